@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# Без аргументов командной строки Kivy и без лишнего вывода в консоль.
+# На сервере без GPU запускать под виртуальным дисплеем: xvfb-run -a python bench_paint.py
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from kivy.base import EventLoop
+from kivy.core.window import Window
+from kivy.graphics import InstructionGroup
+from kivy.graphics.opengl import glFinish
+
+from lz3 import PaintWidget
+
+# Допустимое ухудшение метрики относительно базовой линии
+TOLERANCE = 0.10
+COMPARED = ("us_per_event", "frame_ms", "bytes_per_shape", "instructions_per_shape")
+
+
+class ReplayTouch:
+    """Минимальное касание для прямого вызова обработчиков PaintWidget."""
+
+    __slots__ = ("uid", "x", "y", "ud", "grab_current", "grab_list")
+
+    def __init__(self, uid, x, y):
+        self.uid = uid
+        self.x = x
+        self.y = y
+        self.ud = {}
+        self.grab_current = None
+        self.grab_list = []
+
+    @property
+    def pos(self):
+        return self.x, self.y
+
+    def grab(self, widget):
+        self.grab_list.append(widget)
+
+    def ungrab(self, widget):
+        if widget in self.grab_list:
+            self.grab_list.remove(widget)
+
+
+# Генераторы сценариев: список событий (вид, фигура, uid, x, y)
+def taps(rng, count, w, h):
+    events = []
+    shapes = ("star", "triangle", "rounded_rectangle", "line")
+    for i in range(count):
+        shape = shapes[i % len(shapes)]
+        for _ in range(2 if shape == "line" else 1):
+            x, y = rng.uniform(0, w), rng.uniform(0, h)
+            events.append(("down", shape, i, x, y))
+            events.append(("up", shape, i, x, y))
+    return events
+
+
+def beziers(rng, count, w, h):
+    events = []
+    for i in range(count * 3):
+        x, y = rng.uniform(0, w), rng.uniform(0, h)
+        events.append(("down", "bezier", i, x, y))
+        events.append(("up", "bezier", i, x, y))
+    return events
+
+
+def drags(rng, count, w, h, length=120):
+    events = []
+    for i in range(count):
+        x, y = rng.uniform(0, w), rng.uniform(0, h)
+        events.append(("down", "freehand", i, x, y))
+        for _ in range(length):
+            x = min(max(x + rng.uniform(-4, 4), 0), w)
+            y = min(max(y + rng.uniform(-4, 4), 0), h)
+            events.append(("move", "freehand", i, x, y))
+        events.append(("up", "freehand", i, x, y))
+    return events
+
+
+def eraser_sweeps(rng, count, w, h):
+    # Сначала рисуем фигуры, потом проходим по ним ластиком
+    events = taps(rng, count, w, h)
+    for i in range(count):
+        y = rng.uniform(0, h)
+        for step in range(20):
+            x = w * step / 19
+            events.append(("down", "eraser", count + i, x, y))
+            events.append(("up", "eraser", count + i, x, y))
+    return events
+
+
+SCENARIOS = {"taps": taps, "beziers": beziers, "drags": drags, "eraser": eraser_sweeps}
+
+
+def count_instructions(group):
+    total = 0
+    stack = [group]
+    while stack:
+        for child in stack.pop().children:
+            total += 1
+            if isinstance(child, InstructionGroup):
+                stack.append(child)
+    return total
+
+
+def frame_time(frames):
+    """Среднее время кадра в мс, включая ожидание GPU."""
+    for _ in range(3):
+        Window.dispatch("on_draw")
+        Window.flip()
+    glFinish()
+    start = time.perf_counter()
+    for _ in range(frames):
+        Window.canvas.ask_update()
+        Window.dispatch("on_draw")
+        Window.flip()
+    glFinish()
+    return (time.perf_counter() - start) * 1000 / frames
+
+
+def feed(events, use_mesh):
+    """Подаёт события новому виджету в окне; возвращает виджет и чистое время обработчиков."""
+    widget = PaintWidget(size=Window.size, pos=(0, 0))
+    widget.use_mesh = use_mesh
+    widget.reset_canvas()
+    Window.add_widget(widget)
+    touches = {}
+    handlers = {"down": widget.on_touch_down, "move": widget.on_touch_move, "up": widget.on_touch_up}
+    elapsed = 0.0
+    for kind, shape, uid, x, y in events:
+        widget.shape = shape
+        touch = touches.get(uid)
+        if touch is None:
+            touch = touches[uid] = ReplayTouch(uid, x, y)
+        touch.x, touch.y = x, y
+        touch.grab_current = widget if widget in touch.grab_list else None
+        start = time.perf_counter()
+        handlers[kind](touch)
+        elapsed += time.perf_counter() - start
+        if kind == "up":
+            del touches[uid]
+    widget.sync_live_strokes()
+    widget.renderer.flush()
+    return widget, elapsed
+
+
+def replay(events, use_mesh=False, frames=30):
+    # Время и память — в разных прогонах: tracemalloc замедляет каждое выделение и исказил бы us_per_event
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    widget, _ = feed(events, use_mesh)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    Window.remove_widget(widget)
+    del widget
+
+    widget, elapsed = feed(events, use_mesh)
+    shapes = max(len(widget.document), 1)
+    instructions = count_instructions(widget.canvas) + count_instructions(widget.canvas.before)
+    result = {
+        "events": len(events),
+        "shapes": len(widget.document),
+        "us_per_event": elapsed * 1e6 / max(len(events), 1),
+        "instructions": instructions,
+        "instructions_per_shape": instructions / shapes,
+        "bytes_per_shape": memory / shapes,
+        "frame_ms": frame_time(frames),
+    }
+    Window.remove_widget(widget)
+    return result
+
+
+def load_recording(path):
+    """Запись касаний: JSON-список [вид, фигура, uid, x, y]."""
+    with open(path, encoding="utf-8") as f:
+        return [tuple(event) for event in json.load(f)]
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for name, metrics in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in COMPARED:
+            if base.get(key) and metrics[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {base[key]:.2f} -> {metrics[key]:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmark of PaintWidget (lz3.py)")
+    parser.add_argument("--count", type=int, default=1000, help="shapes per scenario")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all")
+    parser.add_argument("--replay", help="recorded touch stream (JSON)")
+    parser.add_argument("--mesh", action="store_true", help="use the batched Mesh backend")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    EventLoop.ensure_window()
+    w, h = Window.size
+    streams = {}
+    if args.replay:
+        streams["replay"] = load_recording(args.replay)
+    for name in args.scenario or ([] if args.replay else sorted(SCENARIOS)):
+        streams[name] = SCENARIOS[name](random.Random(args.seed), args.count, w, h)
+
+    results = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                 "window": [w, h], "mesh": args.mesh, "count": args.count, "seed": args.seed},
+        "scenarios": {},
+    }
+    for name, events in streams.items():
+        metrics = replay(events, use_mesh=args.mesh, frames=args.frames)
+        results["scenarios"][name] = metrics
+        print(f"{name:8} {metrics['shapes']:7} shapes  {metrics['us_per_event']:8.1f} us/event  "
+              f"{metrics['instructions']:7} instr  {metrics['bytes_per_shape']:8.0f} B/shape  "
+              f"{metrics['frame_ms']:6.2f} ms/frame")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import time
+
+from db_pool import ConnectionPool
+from user_repository import SqliteBackend, UserRepository
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    login TEXT NOT NULL,
+    password TEXT NOT NULL,
+    fio TEXT,
+    email TEXT,
+    phone TEXT
+)"""
+
+
+def fill(path, count, batch=100000):
+    """Заполняет SQLite-базу count пользователями user0..userN (если их там ещё нет)."""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute(SCHEMA)
+    have = connection.execute("SELECT count(*) FROM users").fetchone()[0]
+    for start in range(have, count, batch):
+        rows = ((f"user{i}", f"pw{i}", f"User {i}", f"user{i}@example.com", "+7 900 000 00 00")
+                for i in range(start, min(start + batch, count)))
+        with connection:
+            connection.executemany("INSERT INTO users (login, password, fio, email, phone) VALUES (?, ?, ?, ?, ?)",
+                                   rows)
+    connection.close()
+
+
+def measure(call, logins, repeat):
+    samples = []
+    for _ in range(repeat):
+        login = random.choice(logins)
+        start = time.perf_counter()
+        call(login)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {"median_us": statistics.median(samples), "p99_us": samples[int(len(samples) * 0.99) - 1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="UserRepository lookup latency on a local SQLite stand-in")
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--db", default="bench_users.sqlite3")
+    parser.add_argument("--repeat", type=int, default=10000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    fill(args.db, args.users)
+    print(f"fill: {time.perf_counter() - start:.1f} s, {os.path.getsize(args.db) / 2 ** 20:.0f} MB")
+
+    pool = ConnectionPool(lambda: sqlite3.connect(args.db, check_same_thread=False), maxconn=1)
+    repository = UserRepository(pool, SqliteBackend())
+    start = time.perf_counter()
+    repository.profile("user0")  # создаёт уникальный индекс по login при первом обращении
+    print(f"login index: {time.perf_counter() - start:.1f} s")
+
+    logins = [f"user{random.randrange(args.users)}" for _ in range(1000)]
+    for name, call in (("authenticate", lambda login: repository.authenticate(login, "pw" + login[4:])),
+                       ("find", lambda login: repository.find(login, "pw" + login[4:])),
+                       ("profile", repository.profile)):
+        result = measure(call, logins, args.repeat)
+        print(f"{name:12} median {result['median_us']:7.1f} us   p99 {result['p99_us']:7.1f} us")
+    pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from kivy.clock import Clock
+
+PENDING = "pending"
+DONE = "done"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+
+
+class DbTask:
+    """Запрос в фоновом потоке; колбэки вызываются в UI-потоке через Clock."""
+
+    __slots__ = ("future", "on_result", "on_error", "timeout_event", "state")
+
+    def __init__(self, future, on_result, on_error):
+        self.future = future
+        self.on_result = on_result
+        self.on_error = on_error
+        self.timeout_event = None
+        self.state = PENDING
+
+    def cancel(self):
+        """Отменяет ожидание результата; уже выполняющийся запрос дорабатывает, но результат отбрасывается."""
+        if self.state != PENDING:
+            return False
+        self.state = CANCELLED
+        self.future.cancel()
+        if self.timeout_event is not None:
+            self.timeout_event.cancel()
+        return True
+
+    def _finish(self, future):
+        if self.state != PENDING:
+            return
+        self.state = DONE
+        if self.timeout_event is not None:
+            self.timeout_event.cancel()
+        error = future.exception()
+        if error is not None:
+            if self.on_error is not None:
+                self.on_error(error)
+        elif self.on_result is not None:
+            self.on_result(future.result())
+
+    def _expire(self, dt):
+        if self.state != PENDING:
+            return
+        self.state = TIMED_OUT
+        self.future.cancel()
+        if self.on_error is not None:
+            self.on_error(TimeoutError("database request timed out"))
+
+
+class DbExecutor:
+    def __init__(self, max_workers=4, timeout=10.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self.timeout = timeout
+
+    def submit(self, fn, *args, on_result=None, on_error=None, timeout=None):
+        future = self.executor.submit(fn, *args)
+        task = DbTask(future, on_result, on_error)
+        timeout = self.timeout if timeout is None else timeout
+        if timeout:
+            task.timeout_event = Clock.schedule_once(task._expire, timeout)
+        future.add_done_callback(lambda f: Clock.schedule_once(lambda dt: task._finish(f)))
+        return task
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
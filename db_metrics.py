@@ -0,0 +1,136 @@
+from array import array
+import json
+import time
+
+# Гистограмма в стиле HDR: 2**SUB_BITS линейных корзин на каждую степень двойки,
+# относительная погрешность не больше 1 / 2**(SUB_BITS - 1)
+SUB_BITS = 7
+BUCKETS = 64 << SUB_BITS
+
+
+def bucket_index(value):
+    if value < 1 << SUB_BITS:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_value(index):
+    """Нижняя граница значений корзины."""
+    shift, mantissa = divmod(index, 1 << SUB_BITS)
+    return mantissa << shift
+
+
+def bucket_upper(index):
+    """Верхняя (не включительно) граница значений корзины."""
+    return bucket_value(index) + (1 << (index >> SUB_BITS))
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns):
+        # Без блокировки: при гонке потоков возможна потеря единичного отсчёта, но не порча данных
+        self.counts[bucket_index(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        target = self.count * p / 100
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= target:
+                return bucket_value(index)
+        return self.max
+
+    def buckets(self):
+        """Непустые корзины: (нижняя граница в нс, число замеров)."""
+        return [(bucket_value(i), n) for i, n in enumerate(self.counts) if n]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.percentile(50) / 1000,
+            "p90_us": self.percentile(90) / 1000,
+            "p99_us": self.percentile(99) / 1000,
+            "max_us": self.max / 1000,
+        }
+
+
+class Timer:
+    """with metrics.timer("name"): ... — дешевле contextmanager-генератора."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+    def record(self, name, ns):
+        self.histogram(name).record(ns)
+
+    def increment(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        return Timer(self.histogram(name))
+
+    def to_json(self, extra=None):
+        data = {
+            "histograms": {name: h.summary() for name, h in sorted(self.histograms.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if extra:
+            data.update(extra)
+        return json.dumps(data, indent=2)
+
+    def to_prometheus(self, prefix="lab4"):
+        """Текстовый формат Prometheus: гистограммы в секундах, только непустые корзины."""
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{prefix}_{name.replace('.', '_')}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            seen = 0
+            for low, n in histogram.buckets():
+                seen += n
+                upper = bucket_upper(bucket_index(low))
+                lines.append(f'{metric}_bucket{{le="{upper / 1e9:.9g}"}} {seen}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.total / 1e9:.9g}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, value in sorted(self.counters.items()):
+            metric = f"{prefix}_{name.replace('.', '_')}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+import threading
+import time
+
+# Соединение, простоявшее дольше, проверяется запросом перед выдачей
+HEALTH_CHECK_INTERVAL = 30.0
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PoolMetrics:
+    __slots__ = ("checkouts", "created", "discarded", "wait_total", "wait_max", "in_use", "idle")
+
+    def __init__(self):
+        self.checkouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.in_use = 0
+        self.idle = 0
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["wait_avg"] = self.wait_total / self.checkouts if self.checkouts else 0.0
+        return data
+
+
+class ConnectionPool:
+    """Пул соединений в стиле psycopg2.pool: min/max, проверка живости и переподключение."""
+
+    def __init__(self, connect, minconn=1, maxconn=5, timeout=5.0,
+                 broken_errors=(), health_query="SELECT 1"):
+        self.connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.broken_errors = broken_errors
+        self.health_query = health_query
+        self.metrics = PoolMetrics()
+        self._idle = []  # (соединение, время возврата)
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _open(self):
+        connection = self.connect()
+        self.metrics.created += 1
+        return connection
+
+    def _healthy(self, connection, returned_at):
+        if getattr(connection, "closed", 0):
+            return False
+        if time.monotonic() - returned_at < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        start = time.perf_counter()
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    self.metrics.idle = len(self._idle)
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    connection = None
+                    break
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size >= self.maxconn:
+                        raise PoolTimeout(f"no free connection in {self.timeout} s")
+            self.metrics.in_use += 1
+
+        # Подключение и проверка идут вне блокировки
+        try:
+            if connection is not None and not self._healthy(connection, returned_at):
+                self._close(connection)
+                self.metrics.discarded += 1
+                connection = None
+            if connection is None:
+                connection = self._open()
+        except Exception:
+            self._release_slot()
+            raise
+
+        waited = time.perf_counter() - start
+        with self._cond:
+            self.metrics.checkouts += 1
+            self.metrics.wait_total += waited
+            self.metrics.wait_max = max(self.metrics.wait_max, waited)
+        return connection
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self.metrics.in_use -= 1
+            self._cond.notify()
+
+    def putconn(self, connection, broken=False):
+        if broken or getattr(connection, "closed", 0):
+            self._close(connection)
+            self.metrics.discarded += 1
+            self._release_slot()
+            if self._size < self.minconn:
+                # Замену открываем в фоне: вызывающий поток и так уже обрабатывает ошибку
+                threading.Thread(target=self._refill, name="db-pool-refill", daemon=True).start()
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self.metrics.in_use -= 1
+            self.metrics.idle = len(self._idle)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        try:
+            yield connection
+        except self.broken_errors:
+            self.putconn(connection, broken=True)
+            raise
+        except BaseException:
+            self.putconn(connection)
+            raise
+        else:
+            self.putconn(connection)
+
+    def prefill(self):
+        """Открывает соединения заранее, пока в пуле их меньше minconn."""
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self.metrics.idle = len(self._idle)
+                self._cond.notify()
+
+    def _refill(self):
+        try:
+            self.prefill()
+        except Exception:
+            pass  # Сервер недоступен — соединение откроет следующий getconn
+
+    def closeall(self):
+        with self._cond:
+            for connection, _ in self._idle:
+                self._close(connection)
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self.metrics.idle = 0
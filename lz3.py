@@ -1,16 +1,36 @@
-from tkinter import Label
-
 from kivy.app import App
 from kivy.uix.floatlayout import FloatLayout
 from kivy.uix.widget import Widget
-from kivy.graphics import Line, Color, Ellipse, Rectangle, RoundedRectangle
+from kivy.graphics import (Line, Color, Rectangle, RoundedRectangle, InstructionGroup,
+                           PushMatrix, PopMatrix, Translate, Scale)
 from kivy.uix.button import Button
+from kivy.uix.togglebutton import ToggleButton
+from kivy.clock import Clock
+import os
+import time
 from kivy.uix.colorpicker import ColorPicker
 from kivy.uix.slider import Slider
-import math
-import random
+from paint_document import StrokeDocument
+from paint_index import SpatialGrid, stroke_box, polyline_hit
+from paint_freehand import FreehandStroke
+from paint_export import PngExporter
+from paint_format import DrawingWriter, open_recovered
+from paint_layers import LayerStack
+from paint_mesh import MeshRenderer
+from paint_tessellation import (tessellate, place, star_template, triangle_template,
+                                polyline_triangles, fan_triangles, rounded_rect_outline, simplify)
+
+ERASER_RADIUS = 10
+FREEHAND_TOLERANCE = 1.0
+LIVE_STROKES = 64  # Newest strokes that stay as vector instructions
+BAKE_BATCH = 256  # Strokes are baked in batches so a layer re-renders rarely
+DRAWING_FILE = "drawing.pntd"
+AUTOSAVE_FILE = "autosave.png"
+AUTOSAVE_INTERVAL = 30
 
 class PaintWidget(Widget):
+    __events__ = ("on_history",)  # The undo/redo history changed
+
     def __init__(self, **kwargs):
         super(PaintWidget, self).__init__(**kwargs)
         self.current_color = [1, 1, 1, 1]
@@ -20,77 +40,324 @@ class PaintWidget(Widget):
         self.shadow_enabled = False
         self.start_point = None  # For single straight lines
         self.control_points = []  # For Bezier curves
+        self.document = StrokeDocument()
+        self.index = SpatialGrid()  # Stroke bounding boxes for the eraser
+        self.groups = []  # InstructionGroup per stroke, same index as in document; None if not rendered
+        self.instructions = []  # Group contents, kept to restore a group on undo/redo
+        self.use_mesh = False  # Batched Mesh backend instead of an instruction group per shape
+        self.renderer = MeshRenderer()
+        self._flush_mesh = Clock.create_trigger(self.renderer.flush)
+        self.live_strokes = {}  # touch.uid -> FreehandStroke being drawn
+        self._sync_live = Clock.create_trigger(self.sync_live_strokes)
+        self.layers = LayerStack(self.canvas.before)  # Older strokes baked into Fbo textures
+        self.baked = 0  # Strokes [0, baked) live in self.layers instead of self.content
+        self.content = InstructionGroup()  # Live strokes; shared with MirrorWidget
+        self.canvas.add(self.content)
+        self.drawn = (0, 0, 0, 0)  # Area the strokes were last rendered for
+        self._redraw = Clock.create_trigger(lambda dt: self.redraw())
+        self.bind(pos=self.update_layers, size=self.update_layers)
 
     def on_touch_down(self, touch):
-        if self.collide_point(*touch.pos):
-            with self.canvas:
-                Color(*self.current_color)
-                if self.shadow_enabled:
-                    Color(0, 0, 0, 0.3)
-                    Rectangle(pos=(touch.x + 5, touch.y - 5),
-                              size=(50 * self.size_multiplier, 50 * self.size_multiplier))
-                Color(*self.current_color)
-
-                if self.shape == "line":
-                    if self.start_point is None:
-                        self.start_point = (touch.x, touch.y)
-                    else:
-                        Line(points=[self.start_point[0], self.start_point[1], touch.x, touch.y], width=self.line_width)
-                        self.start_point = None
-
-                elif self.shape == "bezier":
-                    self.control_points.append((touch.x, touch.y))
-                    if len(self.control_points) == 3:
-                        self.draw_bezier()
-
-                elif self.shape == "star":
-                    self.draw_star(touch.x, touch.y, 50 * self.size_multiplier)
-
-                elif self.shape == "triangle":
-                    self.draw_triangle(touch.x, touch.y, 50 * self.size_multiplier)
-
-                elif self.shape == "rounded_rectangle":
-                    RoundedRectangle(pos=(touch.x - 25 * self.size_multiplier, touch.y - 25 * self.size_multiplier),
-                                     size=(50 * self.size_multiplier, 50 * self.size_multiplier),
-                                     radius=[10 * self.size_multiplier])
-
-                elif self.shape == "eraser":
-                    Color(1, 1, 1, 1)
-                    if random.choice([True, False]):
-                        Ellipse(pos=(touch.x - 10, touch.y - 10), size=(20, 20))
-                    else:
-                        Rectangle(pos=(touch.x - 10, touch.y - 10), size=(20, 20))
-
-    def draw_bezier(self):
-        p0, p1, p2 = self.control_points
-        points = []
-        for t in [i / 100.0 for i in range(101)]:
-            x = (1 - t) ** 2 * p0[0] + 2 * (1 - t) * t * p1[0] + t ** 2 * p2[0]
-            y = (1 - t) ** 2 * p0[1] + 2 * (1 - t) * t * p1[1] + t ** 2 * p2[1]
-            points.extend([x, y])
-        Line(points=points, width=self.line_width)
-        self.control_points.clear()
-
-    def draw_star(self, x, y, size):
-        points = []
-        for i in range(10):
-            angle = math.radians(i * 36)
-            radius = size if i % 2 == 0 else size / 2
-            points.extend([x + radius * math.cos(angle), y + radius * math.sin(angle)])
-        Line(points=points, close=True, width=self.line_width)
-
-    def draw_triangle(self, x, y, size):
-        points = [
-            x, y + size,
-            x - size / 2, y - size / 2,
-            x + size / 2, y - size / 2
-        ]
-        Line(points=points, close=True, width=self.line_width)
+        if not self.collide_point(*touch.pos):
+            return
+
+        if self.shape == "eraser":
+            self.erase_at(touch.x, touch.y)
+            return
+
+        if self.shape == "freehand":
+            stroke = FreehandStroke(touch.x, touch.y, self.current_color, self.line_width)
+            self.live_strokes[touch.uid] = stroke
+            self.content.add(stroke.group)
+            touch.grab(self)
+            return True
+
+        if self.shape == "line":
+            if self.start_point is None:
+                self.start_point = (touch.x, touch.y)
+                return
+            points = [self.start_point[0], self.start_point[1], touch.x, touch.y]
+            self.start_point = None
+
+        elif self.shape == "bezier":
+            self.control_points.append((touch.x, touch.y))
+            if len(self.control_points) < 3:
+                return
+            points = [c for point in self.control_points for c in point]
+            self.control_points.clear()
+
+        else:
+            points = [touch.x, touch.y]
+
+        self.add_stroke(self.shape, points)
+
+    def on_touch_move(self, touch):
+        if touch.grab_current is not self:
+            return super(PaintWidget, self).on_touch_move(touch)
+        stroke = self.live_strokes.get(touch.uid)
+        if stroke is not None and stroke.append(touch.x, touch.y):
+            self._sync_live()
+        return True
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is not self:
+            return super(PaintWidget, self).on_touch_up(touch)
+        touch.ungrab(self)
+        stroke = self.live_strokes.pop(touch.uid, None)
+        if stroke is not None:
+            if stroke.group in self.content.children:
+                self.content.remove(stroke.group)
+            stroke.append(touch.x, touch.y)
+            points = simplify(stroke.points, FREEHAND_TOLERANCE)
+            if len(points) >= 4:
+                self.add_stroke("freehand", points)
+        return True
+
+    def sync_live_strokes(self, *args):
+        for stroke in self.live_strokes.values():
+            stroke.sync()
+
+    def add_stroke(self, shape, points):
+        index = self.document.add(shape, self.current_color, self.line_width, points,
+                                  size=50 * self.size_multiplier, shadow=self.shadow_enabled)
+        doc = self.document
+        self.index.insert(index, stroke_box(shape, points, doc.sizes[index], doc.widths[index]))
+        self.render_stroke(index)
+        self.bake_old_strokes()
+        self.dispatch("on_history")
+        return index
+
+    def render_stroke(self, index):
+        if self.use_mesh:
+            self.renderer.add(index, self.stroke_triangles(index))
+            self._flush_mesh()
+            return
+        group = self.build_group(index)
+        missing = index + 1 - len(self.groups)
+        if missing > 0:
+            self.groups.extend([None] * missing)
+            self.instructions.extend([None] * missing)
+        self.groups[index] = group
+        self.instructions[index] = tuple(group.children)
+        self.content.add(group)
+
+    def bake_old_strokes(self):
+        """Переносит старые штрихи с канваса в Fbo-слои, вектором остаются последние LIVE_STROKES."""
+        if self.use_mesh:
+            return
+        upto = len(self.groups) - LIVE_STROKES
+        if upto - self.baked < BAKE_BATCH:
+            return
+        for i in range(self.baked, upto):
+            group = self.groups[i]
+            if group is None:
+                continue
+            self.content.remove(group)
+            self.layers.add(group)
+        self.baked = upto
+
+    def update_layers(self, *args):
+        self.layers.resize(self.pos, self.size)
+        x0, y0, x1, y1 = self.drawn
+        if self.x < x0 or self.y < y0 or self.right > x1 or self.top > y1:
+            self._redraw()  # Strokes that just came into view are not rendered yet
+
+    def stroke_triangles(self, index):
+        """Геометрия штриха для MeshRenderer: список (цвет, треугольники)."""
+        doc = self.document
+        points = doc.stroke_points(index).tolist()
+        size = doc.sizes[index]
+        width = doc.widths[index]
+        shape = doc.shape(index)
+        parts = []
+        if doc.has_shadow(index):
+            x, y = points[-2] + 5, points[-1] - 5
+            parts.append(((0, 0, 0, 0.3), fan_triangles([x, y, x + size, y, x + size, y + size, x, y + size])))
+        if shape in ("line", "freehand"):
+            triangles = polyline_triangles(points, width)
+        elif shape == "bezier":
+            triangles = polyline_triangles(tessellate(points), width)
+        elif shape == "star":
+            triangles = polyline_triangles(place(star_template(), points[0], points[1], size), width, closed=True)
+        elif shape == "triangle":
+            triangles = polyline_triangles(place(triangle_template(), points[0], points[1], size), width, closed=True)
+        else:
+            triangles = fan_triangles(rounded_rect_outline(points[0] - size / 2, points[1] - size / 2,
+                                                           size, size, size / 5))
+        parts.append((doc.color(index), triangles))
+        return parts
+
+    def build_group(self, index):
+        """Собирает InstructionGroup штриха по данным документа."""
+        doc = self.document
+        points = doc.stroke_points(index).tolist()
+        size = doc.sizes[index]
+        group = InstructionGroup()
+        if doc.has_shadow(index):
+            group.add(Color(0, 0, 0, 0.3))
+            group.add(Rectangle(pos=(points[-2] + 5, points[-1] - 5), size=(size, size)))
+        group.add(Color(*doc.color(index)))
+        group.add(self.make_shape(doc.shape(index), points, size, doc.widths[index]))
+        return group
+
+    def make_shape(self, shape, points, size, width):
+        if shape in ("line", "freehand"):
+            return Line(points=points, width=width)
+        if shape == "bezier":
+            return self.draw_bezier(points, width)
+        if shape == "star":
+            return self.draw_star(points[0], points[1], size, width)
+        if shape == "triangle":
+            return self.draw_triangle(points[0], points[1], size, width)
+        return RoundedRectangle(pos=(points[0] - size / 2, points[1] - size / 2),
+                                size=(size, size), radius=[size / 5])
+
+    def draw_bezier(self, control_points, width):
+        return Line(points=tessellate(control_points), width=width)
+
+    def draw_star(self, x, y, size, width):
+        return Line(points=place(star_template(), x, y, size), close=True, width=width)
+
+    def draw_triangle(self, x, y, size, width):
+        return Line(points=place(triangle_template(), x, y, size), close=True, width=width)
+
+    def erase_at(self, x, y, radius=ERASER_RADIUS):
+        """Удаляет штрихи под ластиком (отменяется через undo)."""
+        doc = self.document
+        hits = []
+        # The grid only narrows candidates by bbox; each one is then tested against its real outline
+        for i in self.index.query(x, y, radius):
+            if doc.is_visible(i) and self.stroke_hit(i, x, y, radius):
+                hits.append(i)
+        erased = doc.erase(hits)
+        if erased:
+            self.set_visible(erased, False)
+            self.dispatch("on_history")
+
+    def stroke_hit(self, index, x, y, radius):
+        """Точная проверка попадания по контуру штриха."""
+        doc = self.document
+        shape = doc.shape(index)
+        points = doc.stroke_points(index).tolist()
+        size = doc.sizes[index]
+        if shape == "rounded_rectangle":
+            # Filled square of side size with corner radius size / 5 (as in make_shape):
+            # distance from the inner square whose corners are the arc centres, against the corner radius
+            corner = size / 5
+            inner = size / 2 - corner
+            dx = max(abs(x - points[0]) - inner, 0)
+            dy = max(abs(y - points[1]) - inner, 0)
+            return dx * dx + dy * dy <= (corner + radius) ** 2
+        if shape == "bezier":
+            points = tessellate(points, tolerance=1.0)
+        elif shape in ("star", "triangle"):
+            template = star_template() if shape == "star" else triangle_template()
+            points = place(template, points[0], points[1], size)
+            points += points[:2]  # Closed outline
+        return polyline_hit(points, x, y, radius + doc.widths[index] / 2)
+
+    def set_visible(self, indices, visible):
+        if self.use_mesh:
+            self.renderer.set_visible(indices, visible)
+            self._flush_mesh()
+            return
+        # Only the stroke's own group is touched, the canvas is never rebuilt.
+        # A baked group re-renders just its own Fbo layer on the next frame.
+        for i in indices:
+            group = self.groups[i] if i < len(self.groups) else None
+            if group is None:
+                continue  # Outside the rendered area; redraw picks up the new state
+            group.clear()
+            if visible:
+                for instruction in self.instructions[i]:
+                    group.add(instruction)
+
+    def undo(self):
+        change = self.document.undo()
+        if change:
+            self.set_visible(*change)
+            self.dispatch("on_history")
+
+    def redo(self):
+        change = self.document.redo()
+        if change:
+            self.set_visible(*change)
+            self.dispatch("on_history")
+
+    def on_history(self):
+        pass
+
+    def reset_canvas(self):
+        self.content.clear()
+        self.layers.clear()
+        self.baked = 0
+        self.groups.clear()
+        self.instructions.clear()
+        self.renderer.clear()
+        if self.use_mesh:
+            self.content.add(self.renderer.group)
+        # A redraw in the middle of a drag keeps the strokes being drawn
+        for stroke in self.live_strokes.values():
+            self.content.add(stroke.group)
+
+    def redraw(self):
+        """Пересоздаёт графику штрихов, попадающих в виджет; точки остальных не читаются."""
+        self.reset_canvas()
+        self.drawn = (self.x, self.y, self.right, self.top)
+        for i in self.index.strokes_in(*self.drawn):
+            self.render_stroke(i)
+            if not self.document.is_visible(i):
+                self.set_visible((i,), False)
+        self.bake_old_strokes()
+
+    def load_drawing(self, drawing):
+        """Заменяет документ штрихами из DrawingFile: в память идут поля таблицы и bbox, точки остаются в файле."""
+        self.clear_canvas()
+        self.document.attach_source(drawing, drawing.column("shape").tobytes(), drawing.column("flags").tobytes(),
+                                    drawing.column("color").astype("f4").tobytes(),
+                                    drawing.column("width").astype("f4").tobytes(),
+                                    drawing.column("size").astype("f4").tobytes())
+        self.index.extend(drawing.column("bbox"))
+        # Rendered once the widget has its real size
+        self._redraw()
+
+    def set_mesh_backend(self, enabled):
+        self.use_mesh = enabled
+        self.redraw()
 
     def clear_canvas(self):
-        self.canvas.clear()
+        self.live_strokes.clear()
+        self.reset_canvas()
+        self.document.clear()
+        self.index.clear()
         self.start_point = None
         self.control_points.clear()
+        self.dispatch("on_history")
+
+class MirrorWidget(Widget):
+    """Зеркальное отражение PaintWidget: те же группы инструкций под преобразованием, без копий."""
+
+    def __init__(self, source, **kwargs):
+        super(MirrorWidget, self).__init__(**kwargs)
+        self.source = source
+        with self.canvas:
+            PushMatrix()
+            self.translate = Translate()
+            self.scale = Scale()
+        self.canvas.add(source.layers.group)
+        self.canvas.add(source.content)
+        self.canvas.add(PopMatrix())
+        self.bind(pos=self.update_transform, size=self.update_transform)
+        source.bind(pos=self.update_transform, size=self.update_transform)
+
+    def update_transform(self, *args):
+        # x' = x + k * (source.right - x_src), y' = y + ky * (y_src - source.y)
+        source = self.source
+        kx = self.width / source.width if source.width else 1
+        ky = self.height / source.height if source.height else 1
+        self.translate.xy = (self.x + kx * source.right, self.y - ky * source.y)
+        self.scale.x = -kx
+        self.scale.y = ky
 
 class PaintApp(App):
     def build(self):
@@ -101,13 +368,13 @@ class PaintApp(App):
         self.paint_widget.pos_hint = {"x": 0, "y": 0}
         layout.add_widget(self.paint_widget)
 
-        self.mirror_widget = PaintWidget()
+        self.mirror_widget = MirrorWidget(self.paint_widget)
         self.mirror_widget.size_hint = (0.5, 1)
         self.mirror_widget.pos_hint = {"x": 0.5, "y": 0}
         layout.add_widget(self.mirror_widget)
 
         clear_btn = Button(text="Очистить", size_hint=(0.1, 0.1), pos_hint={"x": 0, "y": 0.9})
-        clear_btn.bind(on_release=lambda x: self.paint_widget.clear_canvas())
+        clear_btn.bind(on_release=lambda x: self.clear_canvas())
         layout.add_widget(clear_btn)
 
         color_picker = ColorPicker(size_hint=(0.2, 0.5), pos_hint={"x": 0.8, "y": 0.5})
@@ -134,6 +401,10 @@ class PaintApp(App):
         rounded_rect_btn.bind(on_release=lambda x: self.set_shape("rounded_rectangle"))
         layout.add_widget(rounded_rect_btn)
 
+        freehand_btn = Button(text="Кисть", size_hint=(0.1, 0.1), pos_hint={"x": 0, "y": 0.3})
+        freehand_btn.bind(on_release=lambda x: self.set_shape("freehand"))
+        layout.add_widget(freehand_btn)
+
         eraser_btn = Button(text="Ластик", size_hint=(0.1, 0.1), pos_hint={"x": 0.1, "y": 0.9})
         eraser_btn.bind(on_release=lambda x: self.set_shape("eraser"))
         layout.add_widget(eraser_btn)
@@ -143,13 +414,37 @@ class PaintApp(App):
         line_width_slider.bind(value=self.update_line_width)
         layout.add_widget(line_width_slider)
 
+        self.undo_btn = Button(text="Отменить", size_hint=(0.1, 0.1), pos_hint={"x": 0.2, "y": 0.9})
+        self.undo_btn.bind(on_release=lambda x: self.paint_widget.undo())
+        layout.add_widget(self.undo_btn)
+
+        self.redo_btn = Button(text="Повторить", size_hint=(0.1, 0.1), pos_hint={"x": 0.3, "y": 0.9})
+        self.redo_btn.bind(on_release=lambda x: self.paint_widget.redo())
+        layout.add_widget(self.redo_btn)
+        self.paint_widget.bind(on_history=self.update_history_buttons)
+        self.update_history_buttons(self.paint_widget)
+
+        mesh_btn = ToggleButton(text="Mesh", size_hint=(0.1, 0.1), pos_hint={"x": 0.4, "y": 0.9})
+        mesh_btn.bind(state=lambda x, state: self.paint_widget.set_mesh_backend(state == "down"))
+        layout.add_widget(mesh_btn)
+
         # Кнопка сохранения
-        save_btn = Button(text="Сохранить", size_hint=(0.1, 0.1), pos_hint={"x": 0.1, "y": 0.9})
-        save_btn.bind(on_release=self.save_canvas)
-        layout.add_widget(save_btn)
+        self.save_btn = Button(text="Сохранить", size_hint=(0.1, 0.1), pos_hint={"x": 0.1, "y": 0.9})
+        self.save_btn.bind(on_release=self.save_canvas)
+        layout.add_widget(self.save_btn)
+
+        self.drawing = None
+        self.open_drawing()
+        self.exporter = PngExporter()
+        self.autosaved_version = 0
+        Clock.schedule_interval(self.autosave, AUTOSAVE_INTERVAL)
 
         return layout
 
+    def update_history_buttons(self, widget):
+        self.undo_btn.disabled = not widget.document.can_undo()
+        self.redo_btn.disabled = not widget.document.can_redo()
+
     def update_color(self, instance, value):
         self.paint_widget.current_color = value
 
@@ -159,9 +454,65 @@ class PaintApp(App):
     def update_line_width(self, instance, value):
         self.paint_widget.line_width = int(value)
 
+    def open_drawing(self):
+        # Reopen the vector document from the previous session, if any
+        if os.path.exists(DRAWING_FILE):
+            try:
+                drawing = open_recovered(DRAWING_FILE)
+            except (OSError, ValueError) as e:
+                # An unreadable drawing is moved aside, never overwritten
+                broken = f"{DRAWING_FILE}.broken-{int(time.time())}"
+                os.replace(DRAWING_FILE, broken)
+                print(f"{e}; moved to {broken}")
+            else:
+                # Stays open: points of the loaded strokes are read from it on demand
+                self.drawing = drawing
+                self.paint_widget.load_drawing(drawing)
+                self.writer = DrawingWriter(DRAWING_FILE, drawing)
+                return
+        self.writer = DrawingWriter(DRAWING_FILE)
+
+    def close_drawing(self):
+        if self.drawing is not None:
+            self.drawing.close()
+            self.drawing = None
+
+    def clear_canvas(self):
+        self.paint_widget.clear_canvas()
+        # The mapped file has to be closed before the writer truncates it
+        self.close_drawing()
+        self.writer.reset()
+
     def save_canvas(self, instance):
-        self.paint_widget.export_to_png("drawing.png")
-        print("Сохранено как drawing.png")
+        self.writer.sync(self.paint_widget.document)
+        if self.exporter.busy("drawing.png"):
+            return
+        self.exporter.save(self.paint_widget, "drawing.png",
+                           on_progress=self.show_save_progress, on_done=self.save_done)
+
+    def show_save_progress(self, fraction, dt):
+        self.save_btn.text = f"Сохранение {int(fraction * 100)}%"
+
+    def save_done(self, filename, error, dt):
+        self.save_btn.text = "Сохранить"
+        if error is not None:
+            print(error)
+        else:
+            print(f"Сохранено как {filename}")
+
+    def autosave(self, dt):
+        # Re-encodes only the image bands that changed since the previous autosave
+        version = self.paint_widget.document.version
+        if version == self.autosaved_version or self.exporter.busy(AUTOSAVE_FILE):
+            return
+        self.writer.sync(self.paint_widget.document)
+        self.autosaved_version = version
+        self.exporter.save(self.paint_widget, AUTOSAVE_FILE, incremental=True)
+
+    def on_stop(self):
+        self.writer.sync(self.paint_widget.document)
+        self.writer.close()
+        self.close_drawing()
 
 if __name__ == "__main__":
     PaintApp().run()
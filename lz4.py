@@ -6,7 +6,19 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.properties import ObjectProperty
+from kivy.clock import Clock
+from kivy.metrics import dp
+from kivy.core.window import Window
 import psycopg2
+from time import perf_counter_ns
+
+from db_executor import DbExecutor
+from db_metrics import Metrics
+from db_pool import ConnectionPool
+from user_cache import ProfileCache
+from user_import import import_users
+from user_repository import PAGE_SIZE, PostgresBackend, UserRepository
+from write_queue import WriteBehindQueue
 
 # Database configuration
 DB_CONFIG = {
@@ -16,30 +28,86 @@ DB_CONFIG = {
     'password': 'postgres'
 }
 
+DB_CONNECT_TIMEOUT = 5  # seconds
+DB_REQUEST_TIMEOUT = 10  # seconds, the screen gives up waiting after this
+
+# Latency histograms of connects, queries and screen switches; F12 dumps them to files
+METRICS_JSON = "metrics.json"
+METRICS_PROM = "metrics.prom"
+F12_KEY = 293
+
+metrics = Metrics()
+db_backend = PostgresBackend(metrics)
+
+def open_connection():
+    with metrics.timer("db.connect"):
+        connection = psycopg2.connect(connect_timeout=DB_CONNECT_TIMEOUT, **DB_CONFIG)
+    connection.autocommit = True
+    db_backend.prepare(connection)
+    return connection
+
+# User browser: rows are fetched by pages and at most MAX_LOADED_ROWS are kept
+MAX_LOADED_ROWS = 10 * PAGE_SIZE
+ROW_HEIGHT = 32  # dp, must match default_size in the kv rules
+SCROLL_MARGIN = 0.05
+SEARCH_DELAY = 0.3
+
+PENDING_DB = "pending_users.sqlite3"  # Local queue of inserts not yet delivered
+
+# Shared by all screens; connections are opened on first use
+db_pool = ConnectionPool(open_connection, minconn=1, maxconn=5,
+                         broken_errors=(psycopg2.OperationalError, psycopg2.InterfaceError))
+db_executor = DbExecutor(max_workers=db_pool.maxconn, timeout=DB_REQUEST_TIMEOUT)
+profile_cache = ProfileCache(maxsize=1024, ttl=300)
+user_repository = UserRepository(db_pool, db_backend, cache=profile_cache)
+write_queue = WriteBehindQueue(PENDING_DB, user_repository.add_batch)
+
+def dump_metrics():
+    extra = {"pool": db_pool.metrics.as_dict(), "cache": profile_cache.stats()}
+    with open(METRICS_JSON, "w", encoding="utf-8") as f:
+        f.write(metrics.to_json(extra))
+    with open(METRICS_PROM, "w", encoding="utf-8") as f:
+        f.write(metrics.to_prometheus())
+
+def report_error(error):
+    metrics.increment("db.timeouts" if isinstance(error, TimeoutError) else "db.errors")
+    print(error)
+
+# Database calls below run on db_executor worker threads, never on the UI thread
+def import_users_file(path, on_progress):
+    with db_pool.connection() as connection:
+        return import_users(path, connection, on_progress=on_progress)
+
 # Screen Definitions
 class RegistrationScreen(Screen):
     login_input = ObjectProperty(None)
     password_input = ObjectProperty(None)
     error_label = ObjectProperty(None)
+    pending = ObjectProperty(None, allownone=True)  # DbTask of the running login
 
     def connect_to_database(self):
-        try:
-            with psycopg2.connect(**DB_CONFIG) as connection:
-                connection.autocommit = True
-                with connection.cursor() as cursor:
-                    query = ("SELECT * FROM users WHERE login = %s AND password = %s")
-                    cursor.execute(query, (self.login_input.text, self.password_input.text))
-                    result = cursor.fetchone()
-                    if result:
-                        self.error_label.text = ""
-                        return result
-                    else:
-                        self.error_label.text = "User not found!"
-                        return None
-        except Exception as e:
-            self.error_label.text = "Database error!"
-            print(e)
-            return None
+        self.cancel_pending()
+        self.error_label.text = "Connecting..."
+        self.pending = db_executor.submit(user_repository.login, self.login_input.text, self.password_input.text,
+                                          on_result=self.on_user_found, on_error=self.on_database_error)
+
+    def cancel_pending(self):
+        if self.pending is not None and self.pending.cancel():
+            self.error_label.text = "Cancelled"
+        self.pending = None
+
+    def on_user_found(self, result):
+        self.pending = None
+        self.error_label.text = "" if result else "User not found!"
+        self.manager.switch_to_user_info(result)
+
+    def on_database_error(self, error):
+        self.pending = None
+        self.error_label.text = "Database timeout!" if isinstance(error, TimeoutError) else "Database error!"
+        report_error(error)
+
+    def on_leave(self):
+        self.cancel_pending()
 
 class UserInfoScreen(Screen):
     login_label = ObjectProperty(None)
@@ -48,12 +116,12 @@ class UserInfoScreen(Screen):
     email_label = ObjectProperty(None)
     phone_label = ObjectProperty(None)
 
-    def set_data(self, user_data):
-        self.login_label.text = f"Login: {user_data[1]}"
-        self.password_label.text = f"Password: {user_data[2]}"
-        self.fio_label.text = f"Full Name: {user_data[3]}"
-        self.email_label.text = f"Email: {user_data[4]}"
-        self.phone_label.text = f"Phone: {user_data[5]}"
+    def set_data(self, user):
+        self.login_label.text = f"Login: {user.login}"
+        self.password_label.text = f"Password: {user.password}"
+        self.fio_label.text = f"Full Name: {user.fio}"
+        self.email_label.text = f"Email: {user.email}"
+        self.phone_label.text = f"Phone: {user.phone}"
 
 class AddUserScreen(Screen):
     login_input = ObjectProperty(None)
@@ -62,26 +130,216 @@ class AddUserScreen(Screen):
     email_input = ObjectProperty(None)
     phone_input = ObjectProperty(None)
     message_label = ObjectProperty(None)
+    import_input = ObjectProperty(None)
+    queue_label = ObjectProperty(None)
+    pending = ObjectProperty(None, allownone=True)  # DbTask of the running import
 
     def add_user_to_database(self):
+        # Stored locally right away; the write-behind thread delivers it to Postgres
         try:
-            with psycopg2.connect(**DB_CONFIG) as connection:
-                connection.autocommit = True
-                with connection.cursor() as cursor:
-                    query = ("INSERT INTO users (login, password, fio, email, phone) VALUES (%s, %s, %s, %s, %s)")
-                    cursor.execute(query, (
-                        self.login_input.text,
-                        self.password_input.text,
-                        self.fio_input.text,
-                        self.email_input.text,
-                        self.phone_input.text
-                    ))
-                    self.message_label.text = "User added successfully!"
+            write_queue.enqueue(
+                self.login_input.text,
+                self.password_input.text,
+                self.fio_input.text,
+                self.email_input.text,
+                self.phone_input.text
+            )
         except Exception as e:
             self.message_label.text = "Error adding user to database!"
-            print(e)
+            report_error(e)
+            return
+        self.message_label.text = "User queued, it will be saved shortly"
+        self.show_queue(write_queue.pending, write_queue.rejected)
+
+    def show_queue(self, pending, rejected):
+        text = f"Pending inserts: {pending}"
+        if rejected:
+            text += f", rejected: {rejected}"
+        self.queue_label.text = text
+
+    def import_users_from_file(self):
+        if self.pending is not None or not self.import_input.text:
+            return
+        self.message_label.text = "Importing..."
+        # Bulk import runs as long as it needs, so no request timeout here
+        self.pending = db_executor.submit(import_users_file, self.import_input.text, self.report_import_progress,
+                                          on_result=self.on_import_done, on_error=self.on_database_error,
+                                          timeout=0)
+
+    def report_import_progress(self, stats):
+        # Called on the worker thread
+        text = f"Imported {stats.imported}, rejected {stats.rejected} ({stats.fraction:.0%})"
+        Clock.schedule_once(lambda dt: setattr(self.message_label, "text", text))
+
+    def on_import_done(self, stats):
+        self.pending = None
+        self.message_label.text = f"Imported {stats.imported} users, rejected {stats.rejected}"
+
+    def on_database_error(self, error):
+        self.pending = None
+        self.message_label.text = "Error adding user to database!"
+        report_error(error)
+
+class UserBrowserScreen(Screen):
+    search_input = ObjectProperty(None)
+    user_list = ObjectProperty(None)
+    status_label = ObjectProperty(None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = ""
+        self.at_start = True
+        self.at_end = False
+        self.next_rows = None  # Prefetched page that follows the last loaded row
+        self.prefetching = None
+        self.loading_previous = None
+        self.want_next = False  # The list hit the bottom before the prefetch arrived
+        self._search = Clock.create_trigger(self.reload, SEARCH_DELAY)
+
+    def on_enter(self):
+        if not self.user_list.data:
+            self.reload()
+
+    def schedule_search(self):
+        self._search()
+
+    def reload(self, *args):
+        for task in (self.prefetching, self.loading_previous):
+            if task is not None:
+                task.cancel()
+        self.prefix = self.search_input.text.strip()
+        self.user_list.data = []
+        self.user_list.scroll_y = 1
+        self.at_start = True
+        self.at_end = False
+        self.next_rows = None
+        self.prefetching = None
+        self.loading_previous = None
+        self.want_next = True
+        self.prefetch()
+
+    def first_login(self):
+        return self.user_list.data[0]["login"] if self.user_list.data else ""
+
+    def last_login(self):
+        return self.user_list.data[-1]["login"] if self.user_list.data else ""
+
+    def prefetch(self):
+        if self.at_end or self.prefetching is not None or self.next_rows is not None:
+            return
+        prefix, after = self.prefix, self.last_login()
+        self.status_label.text = "Loading..."
+        self.prefetching = db_executor.submit(
+            user_repository.page_after, after, prefix,
+            on_result=lambda rows: self.on_prefetched(prefix, after, rows),
+            on_error=self.on_database_error)
+
+    def on_prefetched(self, prefix, after, rows):
+        self.prefetching = None
+        # The page is stale if a new search started or the window moved meanwhile
+        if prefix != self.prefix or after != self.last_login():
+            self.prefetch()
+            return
+        self.next_rows = rows
+        if self.want_next:
+            self.show_next()
+        self.update_status()
+
+    def show_next(self):
+        if self.next_rows is None:
+            self.want_next = not self.at_end
+            self.prefetch()
+            return
+        rows, self.next_rows = self.next_rows, None
+        self.want_next = False
+        if len(rows) < PAGE_SIZE:
+            self.at_end = True
+        data = self.user_list.data + [self.row_view(row) for row in rows]
+        dropped = max(0, len(data) - MAX_LOADED_ROWS)
+        if dropped:
+            self.at_start = False
+        self.set_data(data[dropped:], -dropped)
+        self.prefetch()
+
+    def show_previous(self):
+        if self.at_start or self.loading_previous is not None:
+            return
+        prefix, before = self.prefix, self.first_login()
+        self.loading_previous = db_executor.submit(
+            user_repository.page_before, before, prefix,
+            on_result=lambda rows: self.on_previous(prefix, before, rows),
+            on_error=self.on_database_error)
+
+    def on_previous(self, prefix, before, rows):
+        self.loading_previous = None
+        if prefix != self.prefix or before != self.first_login():
+            return
+        if len(rows) < PAGE_SIZE:
+            self.at_start = True
+        data = [self.row_view(row) for row in rows] + self.user_list.data
+        if len(data) > MAX_LOADED_ROWS:
+            data = data[:MAX_LOADED_ROWS]
+            # The tail was dropped, so the prefetched page no longer follows it
+            self.at_end = False
+            self.next_rows = None
+        self.set_data(data, len(rows))
+
+    def set_data(self, data, shifted_rows):
+        """Replaces the rows keeping the visible ones in place after rows were added or dropped above."""
+        rv = self.user_list
+        row_height = dp(ROW_HEIGHT)
+        old_range = max(len(rv.data) * row_height - rv.height, 1)
+        top = (1 - rv.scroll_y) * old_range + shifted_rows * row_height
+        rv.data = data
+        new_range = max(len(data) * row_height - rv.height, 1)
+        rv.scroll_y = min(1, max(0, 1 - top / new_range))
+        self.update_status()
+
+    def row_view(self, row):
+        login, fio, email = row
+        return {"text": f"{login}    {fio or ''}    {email or ''}", "login": login}
+
+    def on_list_scroll(self, scroll_y):
+        if scroll_y <= SCROLL_MARGIN:
+            self.show_next()
+        elif scroll_y >= 1 - SCROLL_MARGIN:
+            self.show_previous()
+
+    def update_status(self):
+        loaded = len(self.user_list.data)
+        self.status_label.text = f"{loaded} users loaded" + ("" if self.at_end else ", scroll for more")
+
+    def on_database_error(self, error):
+        self.prefetching = None
+        self.loading_previous = None
+        self.status_label.text = "Database error!"
+        report_error(error)
 
 class CustomScreenManager(ScreenManager):
+    def __init__(self, **kwargs):
+        self.switch_started = None  # (screen name, perf_counter_ns) of the running transition
+        super().__init__(**kwargs)
+        self.on_transition(self, self.transition)
+
+    def on_transition(self, instance, transition):
+        transition.funbind("on_complete", self.record_switch)
+        transition.fbind("on_complete", self.record_switch)
+
+    def on_current(self, instance, value):
+        start = perf_counter_ns()
+        # super() stops an unfinished transition, and stop() fires on_complete right away:
+        # the new switch is registered only afterwards so that call records nothing
+        self.switch_started = None
+        super().on_current(instance, value)
+        self.switch_started = (value, start)
+
+    def record_switch(self, transition):
+        # Switch time runs until the fade animation completes
+        if self.switch_started is not None:
+            name, start = self.switch_started
+            self.switch_started = None
+            metrics.record(f"screen.{name}", perf_counter_ns() - start)
+
     def switch_to_user_info(self, user_data):
         if user_data:
             self.current = "user_info"
@@ -95,6 +353,9 @@ class CustomScreenManager(ScreenManager):
     def switch_to_add_user(self):
         self.current = "add_user"
 
+    def switch_to_user_browser(self):
+        self.current = "user_browser"
+
 # Main Application
 class Lab4App(App):
     def build(self):
@@ -104,13 +365,39 @@ class Lab4App(App):
         registration_screen = RegistrationScreen(name="registration")
         user_info_screen = UserInfoScreen(name="user_info")
         add_user_screen = AddUserScreen(name="add_user")
+        user_browser_screen = UserBrowserScreen(name="user_browser")
 
         manager.add_widget(registration_screen)
         manager.add_widget(user_info_screen)
         manager.add_widget(add_user_screen)
+        manager.add_widget(user_browser_screen)
+
+        write_queue.on_change = lambda pending, rejected: Clock.schedule_once(
+            lambda dt: add_user_screen.show_queue(pending, rejected))
+        # Warm minconn connections so the first login does not pay for the connect
+        db_executor.submit(db_pool.prefill, on_error=report_error, timeout=0)
+        db_executor.submit(user_repository.check_schema, on_error=report_error, timeout=0)
+        write_queue.start()
+        add_user_screen.show_queue(write_queue.pending, write_queue.rejected)
+        Window.bind(on_key_down=self.on_key_down)
 
         return manager
 
+    def on_key_down(self, window, key, scancode, codepoint, modifiers):
+        if key == F12_KEY:
+            dump_metrics()
+            print(f"Metrics written to {METRICS_JSON} and {METRICS_PROM}")
+            return True
+        return False
+
+    def on_stop(self):
+        write_queue.stop()
+        db_executor.shutdown()
+        print("DB pool:", db_pool.metrics.as_dict())
+        print("Profile cache:", profile_cache.stats())
+        dump_metrics()
+        db_pool.closeall()
+
 kv_content = """
 <RegistrationScreen>:
     login_input: login_input
@@ -147,13 +434,17 @@ kv_content = """
             height: '40dp'
 
             Button:
-                text: "Submit"
-                on_press: root.manager.switch_to_user_info(root.connect_to_database())
+                text: "Cancel" if root.pending else "Submit"
+                on_press: root.cancel_pending() if root.pending else root.connect_to_database()
 
             Button:
                 text: "Add User"
                 on_press: root.manager.switch_to_add_user()
 
+            Button:
+                text: "Browse Users"
+                on_press: root.manager.switch_to_user_browser()
+
 <UserInfoScreen>:
     login_label: login_label
     password_label: password_label
@@ -197,6 +488,8 @@ kv_content = """
     email_input: email_input
     phone_input: phone_input
     message_label: message_label
+    import_input: import_input
+    queue_label: queue_label
 
     BoxLayout:
         orientation: 'vertical'
@@ -238,6 +531,25 @@ kv_content = """
             text: ""
             color: 0, 1, 0, 1
 
+        Label:
+            id: queue_label
+            text: ""
+
+        BoxLayout:
+            size_hint_y: None
+            height: '40dp'
+
+            TextInput:
+                id: import_input
+                hint_text: "CSV or JSONL file to import"
+                multiline: False
+
+            Button:
+                text: "Import"
+                size_hint_x: 0.3
+                disabled: root.pending is not None
+                on_press: root.import_users_from_file()
+
         Button:
             text: "Add User"
             on_press: root.add_user_to_database()
@@ -245,6 +557,48 @@ kv_content = """
         Button:
             text: "Back"
             on_press: root.manager.switch_to_registration()
+
+<UserBrowserScreen>:
+    search_input: search_input
+    user_list: user_list
+    status_label: status_label
+
+    BoxLayout:
+        orientation: 'vertical'
+        padding: 20
+        spacing: 10
+
+        TextInput:
+            id: search_input
+            hint_text: "Search by login prefix"
+            multiline: False
+            size_hint_y: None
+            height: '40dp'
+            on_text: root.schedule_search()
+
+        RecycleView:
+            id: user_list
+            viewclass: 'Label'
+            on_scroll_y: root.on_list_scroll(self.scroll_y)
+
+            RecycleBoxLayout:
+                default_size: None, dp(32)
+                default_size_hint: 1, None
+                size_hint_y: None
+                height: self.minimum_height
+                orientation: 'vertical'
+
+        Label:
+            id: status_label
+            text: ""
+            size_hint_y: None
+            height: '30dp'
+
+        Button:
+            text: "Back"
+            size_hint_y: None
+            height: '40dp'
+            on_press: root.manager.switch_to_registration()
 """
 
 from kivy.lang import Builder
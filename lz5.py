@@ -1,16 +1,39 @@
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.animation import Animation
+from kivy.clock import Clock
 from kivy.uix.widget import Widget
-from kivy.graphics import Color, Rectangle
+from kivy.graphics import Color, Rectangle, InstructionGroup
+from kivy.core.text import Label as CoreLabel
 from kivy.uix.relativelayout import RelativeLayout
-from kivy.properties import NumericProperty
+from kivy.uix.slider import Slider
+from kivy.uix.spinner import Spinner
+from kivy.properties import ListProperty, NumericProperty
+from array import array
 import random
+import time
+
+from ttt_ai import AiPlayer
+from ttt_engine import Board, MARKS, O, X
+from ttt_log import DRAW, UNFINISHED, GameArchive, append_game
+
+# Варианты поля: сторона и сколько нужно в ряд для победы
+VARIANTS = {
+    "3×3": (3, 3),
+    "15×15, 5 в ряд": (15, 5),
+    "19×19, 5 в ряд": (19, 5),
+}
+VS_HUMAN = "Два игрока"
+VS_COMPUTER = "Против компьютера"  # Компьютер играет за O
+COMPUTER_NAME = "Компьютер"
+AI_TIME_BUDGET = 1.0  # Секунд на ход компьютера
+SCREEN_IDLE_TIMEOUT = 60  # Скрытый дольше этого экран выгружается (секунды)
+GAME_LOG = "ttt_games.bin"  # Журнал сыгранных партий (ttt_log)
+RESULT_TEXT = {X: f"победа {MARKS[X]}", O: f"победа {MARKS[O]}", DRAW: "ничья", UNFINISHED: "не доиграна"}
 
 class RotatingWidget(RelativeLayout):
     angle = NumericProperty(0)  # Добавляем свойство для угла вращения
@@ -31,12 +54,15 @@ class RotatingWidget(RelativeLayout):
 
 # Виджет с цветным фоном
 class ColoredBackground(Widget):
+    rgba = ListProperty([1, 1, 1, 1])  # Свойство, чтобы его можно было анимировать
+
     def __init__(self, color, **kwargs):
         super().__init__(**kwargs)
-        self.rgba = color  # Инициализация свойства цвета
+        # Одна инструкция Color на всё время жизни виджета: анимация меняет только её значение
         with self.canvas.before:
-            Color(*self.rgba)  # Используем цвет
+            self.color = Color(*color)
             self.rect = Rectangle(size=self.size, pos=self.pos)
+        self.rgba = color  # Инициализация свойства цвета
         self.bind(size=self._update_rect, pos=self._update_rect)
 
     def _update_rect(self, *args):
@@ -45,14 +71,139 @@ class ColoredBackground(Widget):
 
     def on_rgba(self, instance, value):
         """Обновление цвета при изменении rgba"""
-        self.canvas.before.clear()
-        with self.canvas.before:
-            Color(*value)
-            self.rect = Rectangle(size=self.size, pos=self.pos)
+        self.color.rgba = value
+
+
+# Игровое поле на одном canvas: клетки — прямоугольники, а не кнопки, поэтому сотни клеток дёшевы
+class GameGrid(Widget):
+    __events__ = ("on_cell",)
+
+    CELL_COLOR = (0.3, 0.3, 0.7, 1)
+    DISABLED_COLOR = (0.3, 0.3, 0.7, 0.5)
+    MAX_FONT_SIZE = 32
+
+    def __init__(self, side=3, **kwargs):
+        super().__init__(**kwargs)
+        self.side = 0
+        self.spacing = 0
+        self.font_size = 0
+        self.textures = (None, None)  # Текстуры "X" и "O" под текущий размер клетки
+        self.marks = {}  # Клетка -> (игрок, Rectangle)
+        self.cell_color = Color(*self.CELL_COLOR)
+        self.cell_rects = InstructionGroup()
+        self.cells = []  # Rectangle клеток по номеру
+        self.mark_rects = InstructionGroup()
+        self.canvas.add(self.cell_color)
+        self.canvas.add(self.cell_rects)
+        self.canvas.add(Color(1, 1, 1, 1))
+        self.canvas.add(self.mark_rects)
+        self.set_side(side)
+        self.bind(size=self._layout, pos=self._layout)
+        self.fbind("disabled", self._update_color)
+
+    def set_side(self, side):
+        """Перестраивает поле side×side; метки стираются."""
+        self.clear_marks()
+        self.side = side
+        self.spacing = max(1, 15 // side)
+        self.cell_rects.clear()
+        self.cells = [Rectangle() for _ in range(side * side)]
+        for rect in self.cells:
+            self.cell_rects.add(rect)
+        self._layout()
+
+    def cell_box(self, cell):
+        """Позиция и размер клетки; строка 0 — верхняя."""
+        row, col = divmod(cell, self.side)
+        step_x = (self.width + self.spacing) / self.side
+        step_y = (self.height + self.spacing) / self.side
+        return ((self.x + col * step_x, self.top - (row + 1) * step_y + self.spacing),
+                (step_x - self.spacing, step_y - self.spacing))
+
+    def _layout(self, *args):
+        for cell, rect in enumerate(self.cells):
+            rect.pos, rect.size = self.cell_box(cell)
+        width, height = self.cell_box(0)[1]
+        font_size = int(min(self.MAX_FONT_SIZE, 0.8 * width, 0.8 * height))
+        if font_size > 0 and font_size != self.font_size:
+            self.font_size = font_size
+            self.textures = tuple(self._render(mark, font_size) for mark in MARKS)
+        for cell, (player, rect) in self.marks.items():
+            self._place(cell, player, rect)
+
+    @staticmethod
+    def _render(text, font_size):
+        label = CoreLabel(text=text, font_size=font_size)
+        label.refresh()
+        return label.texture
+
+    def _place(self, cell, player, rect):
+        (x, y), (width, height) = self.cell_box(cell)
+        texture = self.textures[player]
+        rect.texture = texture
+        rect.size = texture.size
+        rect.pos = (x + (width - texture.width) / 2, y + (height - texture.height) / 2)
+
+    def set_mark(self, cell, player):
+        rect = Rectangle()
+        self._place(cell, player, rect)
+        self.mark_rects.add(rect)
+        self.marks[cell] = (player, rect)
+
+    def clear_marks(self):
+        self.mark_rects.clear()
+        self.marks.clear()
+
+    def show_board(self, board):
+        """Перерисовывает метки по битовым доскам позиции."""
+        self.clear_marks()
+        for player in (X, O):
+            bits = board.bits[player]
+            while bits:
+                low = bits & -bits
+                self.set_mark(low.bit_length() - 1, player)
+                bits ^= low
+
+    def _update_color(self, instance, disabled):
+        self.cell_color.rgba = self.DISABLED_COLOR if disabled else self.CELL_COLOR
+
+    def on_touch_down(self, touch):
+        if self.disabled or not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+        col = int((touch.x - self.x) * self.side // (self.width + self.spacing))
+        row = int((self.top - touch.y) * self.side // (self.height + self.spacing))
+        if 0 <= row < self.side and 0 <= col < self.side:
+            self.dispatch("on_cell", row * self.side + col)
+        return True
+
+    def on_cell(self, cell):
+        pass
+
+
+# Экран с бесконечными анимациями: они идут, только пока экран показан
+class AnimatedScreen(Screen):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.loops = []  # (Animation, виджет)
+
+    def add_loop(self, anim, widget):
+        anim.repeat = True
+        self.loops.append((anim, widget))
+        if self.manager is not None and self.manager.current_screen is self:
+            anim.start(widget)
+
+    def on_enter(self):
+        for anim, widget in self.loops:
+            anim.start(widget)
+
+    def on_leave(self):
+        # Остановленная анимация снимается с часов Kivy, скрытый экран не тратит CPU
+        for anim, widget in self.loops:
+            anim.cancel(widget)
 
 
 # Первый экран
-class FirstScreen(Screen):
+class FirstScreen(AnimatedScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.add_widget(ColoredBackground((0.2, 0.6, 0.8, 1)))
@@ -80,8 +231,7 @@ class FirstScreen(Screen):
 
     def animate_title(self):
         anim = Animation(opacity=0, duration=0.5) + Animation(opacity=1, duration=0.5)
-        anim.repeat = True
-        anim.start(self.title)
+        self.add_loop(anim, self.title)
 
     def on_pre_enter(self):
         new_width = random.randint(150, 300)
@@ -95,7 +245,7 @@ class FirstScreen(Screen):
 
 
 # Второй экран
-class SecondScreen(Screen):
+class SecondScreen(AnimatedScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.gradient_widget = ColoredBackground((0.8, 0.5, 0.3, 1))
@@ -114,6 +264,15 @@ class SecondScreen(Screen):
         self.player2_input.bind(focus=self.show_tooltip)
         layout.add_widget(self.player2_input)
 
+        # Размер поля
+        self.variant_spinner = Spinner(text=next(iter(VARIANTS)), values=list(VARIANTS), font_size=20,
+                                       size_hint_y=None, height=50)
+        layout.add_widget(self.variant_spinner)
+
+        self.mode_spinner = Spinner(text=VS_HUMAN, values=[VS_HUMAN, VS_COMPUTER], font_size=20,
+                                    size_hint_y=None, height=50)
+        layout.add_widget(self.mode_spinner)
+
         start_game_button = Button(text="Начать игру", font_size=24, size_hint=(0.5, 0.2),
                                    pos_hint={"center_x": 0.5}, background_color=(0.7, 0.3, 0.5, 1),
                                    background_normal="")
@@ -125,8 +284,16 @@ class SecondScreen(Screen):
 
     def start_gradient_animation(self):
         anim = Animation(rgba=(0, 1, 0, 1), duration=1) + Animation(rgba=(0, 0, 1, 1), duration=1)
-        anim.repeat = True
-        anim.start(self.gradient_widget)
+        self.add_loop(anim, self.gradient_widget)
+
+    def get_state(self):
+        return {"players": (self.player1_input.text, self.player2_input.text),
+                "variant": self.variant_spinner.text, "mode": self.mode_spinner.text}
+
+    def set_state(self, state):
+        self.player1_input.text, self.player2_input.text = state["players"]
+        self.variant_spinner.text = state["variant"]
+        self.mode_spinner.text = state["mode"]
 
     def show_tooltip(self, instance, value):
         if value:
@@ -135,35 +302,50 @@ class SecondScreen(Screen):
     def start_game(self, instance):
         player1 = self.player1_input.text
         player2 = self.player2_input.text
+        vs_computer = self.mode_spinner.text == VS_COMPUTER
+        if vs_computer:
+            player2 = player2 or COMPUTER_NAME
 
         if player1 and player2:
-            self.manager.get_screen("screen3").set_players(player1, player2)
+            game_screen = self.manager.get_screen("screen3")
+            game_screen.set_rules(*VARIANTS[self.variant_spinner.text])
+            game_screen.set_opponent(vs_computer)
+            game_screen.set_players(player1, player2)
             self.manager.transition = SlideTransition(direction="left", duration=1)
             self.manager.current = "screen3"
 
+def save_moves(game, moves):
+    """Запись партии в журнал: исход берётся из позиции, без исхода — «не доиграна»."""
+    if not moves:
+        return
+    result = game.winner if game.winner is not None else DRAW if game.is_over() else UNFINISHED
+    try:
+        append_game(GAME_LOG, game.side, game.k, result, moves)
+    except OSError as e:
+        print(e)
+
 # Третий экран (игра)
-class TicTacToeScreen(Screen):
+class TicTacToeScreen(AnimatedScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.add_widget(ColoredBackground((0.4, 0.4, 0.8, 1)))
 
         self.players = ("", "")
-        self.turn = "X"
-        self.board = [None] * 9  # Поле для хранения кнопок
+        self.game = Board()  # Состояние партии; поле только отображает его
+        self.ai = AiPlayer(AI_TIME_BUDGET)
+        self.vs_computer = False
+        self.ai_request = None  # Метка текущего поиска; ответы устаревших поисков отбрасываются
+        self.moves = array("H")  # Ходы текущей партии для журнала
 
         self.layout = BoxLayout(orientation="vertical", spacing=10, padding=20)
 
         # Статус хода
-        self.status_label = Label(text="Ход: X", font_size=24, color=(1, 1, 1, 1), size_hint_y=None, height=50)
+        self.status_label = Label(text=f"Ход: {MARKS[X]}", font_size=24, color=(1, 1, 1, 1), size_hint_y=None, height=50)
         self.layout.add_widget(self.status_label)
 
         # Игровое поле
-        self.grid = GridLayout(cols=3, spacing=5, size_hint_y=0.6)
-        for i in range(9):
-            btn = Button(font_size=32, text="", background_color=(0.3, 0.3, 0.7, 1))
-            btn.bind(on_press=self.make_move)
-            self.grid.add_widget(btn)
-            self.board[i] = btn
+        self.grid = GameGrid(side=self.game.side, size_hint_y=0.6)
+        self.grid.bind(on_cell=self.make_move)
         self.layout.add_widget(self.grid)
 
         # Двигающаяся кнопка перезапуска
@@ -175,63 +357,282 @@ class TicTacToeScreen(Screen):
         self.layout.add_widget(restart_button)
         self.start_moving(restart_button)
 
+        replay_button = Button(text="Повтор партий", font_size=20,
+                               size_hint=(0.5, 0.1), pos_hint={"center_x": 0.5},
+                               background_color=(0.3, 0.5, 0.6, 1),
+                               background_normal="")
+        replay_button.bind(on_press=self.go_to_replay)
+        self.layout.add_widget(replay_button)
+
         self.add_widget(self.layout)
 
     def start_moving(self, button):
         # Animation to move the button back and forth
         anim = Animation(pos_hint={"center_x": 0.6}, duration=1) + Animation(pos_hint={"center_x": 0.4}, duration=1)
-        anim.repeat = True
-        anim.start(button)
+        self.add_loop(anim, button)
+
+    @property
+    def turn(self):
+        return MARKS[self.game.turn]
+
+    def set_rules(self, side, k):
+        """Новое поле side×side, k в ряд; при тех же правилах партия сохраняется."""
+        if (side, k) == (self.game.side, self.game.k):
+            return
+        self.cancel_ai()
+        self.save_game()
+        self.game = Board(side, k)
+        self.grid.set_side(side)
+        self.grid.disabled = False
+
+    def set_opponent(self, vs_computer):
+        self.vs_computer = vs_computer
 
     def set_players(self, player1, player2):
         self.players = (player1, player2)
         self.status_label.text = f"Ход: {self.turn} ({self.players[0]})"
 
-    def make_move(self, instance):
-        if instance.text == "":  # Если кнопка пустая
-            instance.text = self.turn
-            if self.check_winner():  # Проверка победы
-                self.status_label.text = f"Победитель: {self.turn} ({self.get_current_player()})"
-                self.disable_board()
-                return
-            self.turn = "O" if self.turn == "X" else "X"  # Смена хода
+    def make_move(self, grid, cell):
+        game = self.game
+        # Клетка занята, партия окончена или думает компьютер
+        if self.ai_request is not None or game.is_over() or not game.free() >> cell & 1:
+            return
+        if self.apply_move(cell) and self.vs_computer:
+            self.request_ai_move()
+
+    def apply_move(self, cell):
+        """Ход текущего игрока; возвращает True, если партия продолжается."""
+        game = self.game
+        player = game.turn
+        won = game.play(cell)
+        self.moves.append(cell)
+        self.grid.set_mark(cell, player)
+        self.show_status()
+        if won:  # Проверка победы
+            self.disable_board()
+        if game.is_over():
+            self.save_game()
+            return False
+        return True
+
+    def save_game(self):
+        """Дописывает партию в журнал; недоигранная тоже сохраняется при перезапуске и выходе."""
+        save_moves(self.game, self.moves)
+        self.moves = array("H")
+
+    def go_to_replay(self, instance):
+        self.manager.transition = SlideTransition(direction="left", duration=1)
+        self.manager.current = "replay"
+
+    def show_status(self):
+        game = self.game
+        if game.winner is not None:
+            self.status_label.text = f"Победитель: {MARKS[game.winner]} ({self.players[game.winner]})"
+        elif game.is_over():
+            self.status_label.text = "Ничья"
+        else:
             self.status_label.text = f"Ход: {self.turn} ({self.get_current_player()})"
 
-    def check_winner(self):
-        # Условия победы
-        win_conditions = [
-            [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Горизонтальные
-            [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Вертикальные
-            [0, 4, 8], [2, 4, 6]             # Диагональные
-        ]
-        for condition in win_conditions:
-            if (self.board[condition[0]].text == self.board[condition[1]].text ==
-                    self.board[condition[2]].text != ""):
-                return True
-        return False
+    def request_ai_move(self):
+        # Поиск идёт в отдельном потоке, ответ возвращается в UI-поток через Clock
+        request = self.ai_request = object()
+        self.status_label.text = f"Ход: {self.turn} ({self.get_current_player()} думает...)"
+        self.ai.start(self.game, lambda cell: Clock.schedule_once(lambda dt: self.on_ai_move(request, cell)))
+
+    def on_ai_move(self, request, cell):
+        if request is not self.ai_request:
+            return
+        self.ai_request = None
+        self.apply_move(cell)
+
+    def cancel_ai(self):
+        self.ai.reset()
+        self.ai_request = None
 
     def disable_board(self):
-        for btn in self.board:
-            btn.disabled = True  # Блокировка кнопок
+        self.grid.disabled = True  # Блокировка поля
 
     def restart_game(self, instance):
-        self.turn = "X"
-        for btn in self.board:
-            btn.text = ""  # Очистка кнопок
-            btn.disabled = False  # Разблокировка
+        self.cancel_ai()
+        self.save_game()
+        self.game.reset()
+        self.grid.clear_marks()  # Очистка поля
+        self.grid.disabled = False  # Разблокировка
         self.status_label.text = f"Ход: {self.turn} ({self.players[0]})"
 
     def get_current_player(self):
-        return self.players[0] if self.turn == "X" else self.players[1]
+        return self.players[self.game.turn]
+
+    def get_state(self):
+        self.cancel_ai()
+        return {"game": self.game.copy(), "moves": self.moves, "players": self.players,
+                "vs_computer": self.vs_computer}
+
+    def set_state(self, state):
+        game = state["game"]
+        self.set_rules(game.side, game.k)
+        self.game = game
+        self.moves = state["moves"]
+        self.players = state["players"]
+        self.vs_computer = state["vs_computer"]
+        self.grid.show_board(game)
+        self.grid.disabled = game.winner is not None
+        self.show_status()
+        if self.vs_computer and game.turn != X and not game.is_over():
+            self.request_ai_move()  # Экран выгрузили, пока компьютер думал
+
+
+# Просмотр сохранённых партий: ползунок переходит к любому ходу
+class ReplayScreen(Screen):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.add_widget(ColoredBackground((0.3, 0.3, 0.5, 1)))
+
+        self.archive = None
+        self.offsets = array("Q")  # Смещения партий в журнале
+        self.index = 0
+        self.replay = None
+
+        layout = BoxLayout(orientation="vertical", spacing=10, padding=20)
+
+        self.status_label = Label(text="", font_size=20, color=(1, 1, 1, 1), size_hint_y=None, height=50)
+        layout.add_widget(self.status_label)
+
+        self.grid = GameGrid(size_hint_y=0.6)
+        layout.add_widget(self.grid)
+
+        self.slider = Slider(min=0, max=0, step=1, size_hint_y=None, height=50)
+        self.slider.bind(value=self.show_ply)
+        layout.add_widget(self.slider)
+
+        buttons = BoxLayout(spacing=10, size_hint_y=None, height=50)
+        for text, callback in (("< Партия", self.previous_game), ("Партия >", self.next_game),
+                               ("Назад", self.go_back)):
+            button = Button(text=text, font_size=20, background_color=(0.3, 0.5, 0.6, 1), background_normal="")
+            button.bind(on_press=callback)
+            buttons.add_widget(button)
+        layout.add_widget(buttons)
+
+        self.add_widget(layout)
+
+    def on_pre_enter(self):
+        try:
+            self.archive = GameArchive(GAME_LOG)
+        except (OSError, ValueError) as e:
+            print(e)
+            self.status_label.text = "Нет сохранённых партий"
+            return
+        self.offsets = array("Q", (header[0] for header in self.archive.scan()))
+        self.show_game(len(self.offsets) - 1)
+
+    def on_leave(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        self.offsets = array("Q")
+        self.replay = None
+
+    def show_game(self, index):
+        if not self.offsets:
+            self.status_label.text = "Нет сохранённых партий"
+            return
+        self.index = max(0, min(index, len(self.offsets) - 1))
+        self.replay = self.archive.replay(self.offsets[self.index])
+        if self.grid.side != self.replay.side:
+            self.grid.set_side(self.replay.side)
+        self.slider.max = len(self.replay)
+        self.slider.value = len(self.replay)
+        self.show_ply(self.slider, self.slider.value)
+
+    def show_ply(self, instance, value):
+        if self.replay is None:
+            return
+        ply = int(value)
+        self.grid.show_board(self.replay.board_at(ply))
+        self.status_label.text = (f"Партия {self.index + 1} из {len(self.offsets)}, ход {ply} из {len(self.replay)}"
+                                  f" ({RESULT_TEXT[self.replay.result]})")
+
+    def previous_game(self, instance):
+        self.show_game(self.index - 1)
+
+    def next_game(self, instance):
+        self.show_game(self.index + 1)
+
+    def go_back(self, instance):
+        self.manager.transition = SlideTransition(direction="right", duration=1)
+        self.manager.current = "screen3"
+
+
+# ScreenManager, который строит экраны из фабрик при первом показе и выгружает давно скрытые.
+# Экран может отдать состояние через get_state() и получить его обратно в set_state() после пересоздания.
+class LazyScreenManager(ScreenManager):
+    def __init__(self, idle_timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.factories = {}
+        self.states = {}  # Имя -> состояние выгруженного экрана
+        self.hidden_since = {}  # Имя -> время, когда экран перестал быть текущим
+        self.idle_timeout = idle_timeout
+        if idle_timeout:
+            Clock.schedule_interval(self.unload_idle, idle_timeout / 2)
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    def get_screen(self, name):
+        if name in self.factories and not self.has_screen(name):
+            self.build_screen(name)
+        return super().get_screen(name)
+
+    def build_screen(self, name):
+        screen = self.factories[name](name=name)
+        state = self.states.pop(name, None)
+        if state is not None:
+            screen.set_state(state)
+        self.add_widget(screen)
+        return screen
+
+    def on_current(self, instance, value):
+        if self.current_screen is not None:
+            self.hidden_since[self.current_screen.name] = time.monotonic()
+        self.hidden_since.pop(value, None)
+        super().on_current(instance, value)
+
+    def unload_idle(self, dt):
+        if self.transition.is_active:
+            return
+        now = time.monotonic()
+        for name, since in list(self.hidden_since.items()):
+            if now - since < self.idle_timeout or name not in self.factories or not self.has_screen(name):
+                continue
+            screen = super().get_screen(name)
+            if hasattr(screen, "get_state"):
+                self.states[name] = screen.get_state()
+            self.remove_widget(screen)
+            del self.hidden_since[name]
 
 # Приложение
 class EnhancedTicTacToeApp(App):
     def build(self):
-        sm = ScreenManager()
-        sm.add_widget(FirstScreen(name="screen1"))
-        sm.add_widget(SecondScreen(name="screen2"))
-        sm.add_widget(TicTacToeScreen(name="screen3"))
+        # Экраны создаются при первом переходе на них
+        sm = LazyScreenManager(idle_timeout=SCREEN_IDLE_TIMEOUT)
+        sm.register("screen1", FirstScreen)
+        sm.register("screen2", SecondScreen)
+        sm.register("screen3", TicTacToeScreen)
+        sm.register("replay", ReplayScreen)
+        sm.current = "screen1"
         return sm
 
+    def on_stop(self):
+        # Партия, начатая, но не доигранная к закрытию, тоже попадает в журнал
+        sm = self.root
+        if sm.has_screen("screen3"):
+            screen = sm.get_screen("screen3")
+            screen.cancel_ai()
+            screen.save_game()
+        else:
+            state = sm.states.pop("screen3", None)  # Экран выгружен, партия лежит в его состоянии
+            if state is not None:
+                save_moves(state["game"], state["moves"])
+
 if __name__ == "__main__":
     EnhancedTicTacToeApp().run()
@@ -0,0 +1,134 @@
+from array import array
+
+# Фигуры, которые умеет хранить документ (индекс в кортеже = код фигуры)
+SHAPES = ("line", "bezier", "star", "triangle", "rounded_rectangle", "freehand")
+SHAPE_CODES = {name: code for code, name in enumerate(SHAPES)}
+
+# Флаги штриха
+VISIBLE = 1
+SHADOW = 2
+
+# Операции в стеке отмены
+OP_ADD = 0
+OP_ERASE = 1
+
+
+class StrokeDocument:
+    """Компактный список штрихов: все данные лежат в плоских массивах array."""
+
+    __slots__ = ("shapes", "flags", "colors", "widths", "sizes", "offsets", "points", "source", "base", "version",
+                 "_undo", "_redo")
+
+    def __init__(self):
+        self.shapes = array("B")   # код фигуры
+        self.flags = array("B")    # VISIBLE | SHADOW
+        self.colors = array("f")   # 4 float на штрих (rgba)
+        self.widths = array("f")   # толщина линии
+        self.sizes = array("f")    # размер для звезды/треугольника/скругления
+        self.offsets = array("L", [0])  # начало точек штриха base + i в self.points
+        self.points = array("f")   # x0, y0, x1, y1, ... штрихов, нарисованных в этой сессии
+        self.source = None         # DrawingFile, из которого читаются точки штрихов [0, base)
+        self.base = 0
+        self.version = 0           # растёт при каждом изменении документа
+        self._undo = []
+        self._redo = []
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def add(self, shape, color, width, points, size=0.0, shadow=False):
+        """Добавляет штрих и возвращает его индекс."""
+        index = len(self.shapes)
+        self.shapes.append(SHAPE_CODES[shape])
+        self.flags.append(VISIBLE | (SHADOW if shadow else 0))
+        self.colors.extend(color[:4])
+        self.widths.append(width)
+        self.sizes.append(size)
+        self.points.extend(points)
+        self.offsets.append(len(self.points))
+        self._undo.append((OP_ADD, (index,)))
+        self._redo.clear()
+        self.version += 1
+        return index
+
+    def attach_source(self, source, shapes, flags, colors, widths, sizes):
+        """Заменяет документ штрихами файла: копируются только поля таблицы, точки остаются в source."""
+        self.clear()
+        self.shapes.frombytes(shapes)
+        self.flags.frombytes(flags)
+        self.colors.frombytes(colors)
+        self.widths.frombytes(widths)
+        self.sizes.frombytes(sizes)
+        self.source = source
+        self.base = len(self.shapes)
+
+    def erase(self, indices):
+        """Скрывает штрихи как одну отменяемую операцию."""
+        indices = tuple(i for i in indices if self.flags[i] & VISIBLE)
+        if not indices:
+            return ()
+        for i in indices:
+            self.flags[i] &= ~VISIBLE
+        self._undo.append((OP_ERASE, indices))
+        self._redo.clear()
+        self.version += 1
+        return indices
+
+    def undo(self):
+        """Отменяет последнюю операцию. Возвращает (индексы, видимость) или None."""
+        if not self._undo:
+            return None
+        op, indices = self._undo.pop()
+        self._redo.append((op, indices))
+        return self._apply(indices, op == OP_ERASE)
+
+    def redo(self):
+        """Повторяет отменённую операцию. Возвращает (индексы, видимость) или None."""
+        if not self._redo:
+            return None
+        op, indices = self._redo.pop()
+        self._undo.append((op, indices))
+        return self._apply(indices, op == OP_ADD)
+
+    def _apply(self, indices, visible):
+        self.version += 1
+        for i in indices:
+            if visible:
+                self.flags[i] |= VISIBLE
+            else:
+                self.flags[i] &= ~VISIBLE
+        return indices, visible
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        for name in ("shapes", "flags", "colors", "widths", "sizes", "points"):
+            del getattr(self, name)[:]
+        del self.offsets[1:]
+        self.source = None
+        self.base = 0
+        self.version += 1
+        self._undo.clear()
+        self._redo.clear()
+
+    def is_visible(self, index):
+        return bool(self.flags[index] & VISIBLE)
+
+    def has_shadow(self, index):
+        return bool(self.flags[index] & SHADOW)
+
+    def shape(self, index):
+        return SHAPES[self.shapes[index]]
+
+    def color(self, index):
+        return self.colors[index * 4:index * 4 + 4].tolist()
+
+    def stroke_points(self, index):
+        if index < self.base:
+            return array("f", self.source.points(index).tobytes())
+        index -= self.base
+        return self.points[self.offsets[index]:self.offsets[index + 1]]
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import struct
+import zlib
+
+from kivy.clock import Clock
+
+# Высота полосы изображения, которая сжимается и кешируется отдельно
+BAND_HEIGHT = 64
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Пустой последний блок deflate после полос, сжатых с Z_FULL_FLUSH
+DEFLATE_END = b"\x03\x00"
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+
+class BandCache:
+    """Сжатые полосы последнего сохранения: неизменившиеся полосы не сжимаются заново."""
+
+    __slots__ = ("size", "raw", "packed")
+
+    def __init__(self):
+        self.size = None
+        self.raw = []
+        self.packed = []
+
+
+def encode_png(pixels, width, height, cache=None, level=6, on_band=None):
+    """RGBA-пиксели текстуры (начало координат внизу слева) -> байты PNG."""
+    stride = width * 4
+    bands = (height + BAND_HEIGHT - 1) // BAND_HEIGHT
+    if cache is None:
+        cache = BandCache()
+    if cache.size != (width, height):
+        cache.size = (width, height)
+        cache.raw = [None] * bands
+        cache.packed = [None] * bands
+
+    idat = [b"\x78\x9c"]
+    adler = 1
+    for band in range(bands):
+        top = band * BAND_HEIGHT
+        # Строки PNG идут сверху вниз, строки текстуры — снизу вверх
+        raw = b"".join(b"\x00" + pixels[(height - 1 - row) * stride:(height - row) * stride]
+                       for row in range(top, min(top + BAND_HEIGHT, height)))
+        if cache.raw[band] != raw:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            cache.packed[band] = compressor.compress(raw) + compressor.flush(zlib.Z_FULL_FLUSH)
+            cache.raw[band] = raw
+        idat.append(cache.packed[band])
+        adler = zlib.adler32(raw, adler)
+        if on_band is not None:
+            on_band(band + 1, bands)
+    idat.append(DEFLATE_END)
+    idat.append(struct.pack(">I", adler))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join((PNG_SIGNATURE, png_chunk(b"IHDR", header),
+                     png_chunk(b"IDAT", b"".join(idat)), png_chunk(b"IEND", b"")))
+
+
+def write_atomic(filename, data):
+    """Пишет во временный файл рядом и подменяет им целевой."""
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class PngExporter:
+    """Экспорт в PNG: пиксели читаются один раз в UI-потоке, сжатие и запись — в фоне."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.caches = {}  # имя файла -> BandCache для инкрементального сохранения
+        self.pending = {}  # имя файла -> Future последней записи
+
+    def busy(self, filename):
+        future = self.pending.get(filename)
+        return future is not None and not future.done()
+
+    def save(self, widget, filename, incremental=False, on_progress=None, on_done=None):
+        texture = widget.export_as_image().texture
+        width, height = texture.size
+        pixels = texture.pixels
+        cache = self.caches.setdefault(filename, BandCache()) if incremental else None
+        future = self.executor.submit(self._write, pixels, width, height, filename, cache, on_progress)
+        if on_done is not None:
+            future.add_done_callback(lambda f: Clock.schedule_once(partial(on_done, filename, f.exception())))
+        self.pending[filename] = future
+        return future
+
+    def _write(self, pixels, width, height, filename, cache, on_progress):
+        on_band = None
+        if on_progress is not None:
+            on_band = lambda done, total: Clock.schedule_once(partial(on_progress, done / total))
+        write_atomic(filename, encode_png(pixels, width, height, cache, on_band=on_band))
+        return filename
@@ -0,0 +1,194 @@
+from array import array
+from bisect import bisect_right
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from paint_index import stroke_box
+
+# Формат файла рисунка .pntd (little endian):
+#   заголовок: magic, версия, размер записи таблицы, число штрихов
+#   далее сегменты: заголовок сегмента, таблица штрихов, точки float32 штрихов сегмента подряд
+MAGIC = b"PNTD"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ")
+SEGMENT = struct.Struct("<4sIQ")
+SEGMENT_TAG = b"STRK"
+
+ENTRY = np.dtype([
+    ("shape", "u1"),
+    ("flags", "u1"),
+    ("reserved", "<u2"),
+    ("color", "<f4", (4,)),
+    ("width", "<f4"),
+    ("size", "<f4"),
+    ("bbox", "<f4", (4,)),
+    ("offset", "<u8"),   # смещение точек от начала файла
+    ("count", "<u4"),    # число float в точках
+    ("pad", "<u4", (2,)),
+])
+FLAGS_OFFSET = ENTRY.fields["flags"][1]
+
+
+class DrawingFile:
+    """Рисунок, открытый через mmap: таблицы читаются без копирования, точки — по требованию."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size < HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path}: too short for a drawing file")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, entry_size, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or entry_size != ENTRY.itemsize:
+            self.close()
+            raise ValueError(f"{path}: not a drawing file of version {VERSION}")
+        self.tables = []
+        self.table_offsets = []
+        self.starts = []  # глобальный индекс первого штриха сегмента
+        count = 0
+        pos = HEADER.size
+        size = len(self.mm)
+        while pos + SEGMENT.size <= size:
+            tag, n, points_bytes = SEGMENT.unpack_from(self.mm, pos)
+            if tag != SEGMENT_TAG:
+                self.close()
+                raise ValueError(f"{path}: broken segment at {pos}")
+            table_at = pos + SEGMENT.size
+            end = table_at + n * ENTRY.itemsize + points_bytes
+            if end > size:
+                break  # недописанный сегмент после сбоя — игнорируем
+            self.tables.append(np.frombuffer(self.mm, ENTRY, n, table_at))
+            self.table_offsets.append(table_at)
+            self.starts.append(count)
+            count += n
+            pos = end
+        self.count = count
+        self.end = pos  # конец последнего целого сегмента; дальше может быть только недописанный хвост
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.tables = []
+        self.mm.close()
+        self.file.close()
+
+    def _locate(self, index):
+        segment = bisect_right(self.starts, index) - 1
+        return segment, index - self.starts[segment]
+
+    def entry(self, index):
+        segment, row = self._locate(index)
+        return self.tables[segment][row]
+
+    def entry_offsets(self):
+        """Смещения записей всех штрихов в файле, по порядку."""
+        offsets = [table_at + np.arange(len(table), dtype=np.uint64) * ENTRY.itemsize
+                   for table, table_at in zip(self.tables, self.table_offsets)]
+        return np.concatenate(offsets) if offsets else np.empty(0, dtype=np.uint64)
+
+    def column(self, name):
+        """Поле name всех штрихов одним массивом (копия, mmap можно закрыть)."""
+        if not self.tables:
+            return np.empty((0,) + ENTRY[name].shape, dtype=ENTRY[name].base)
+        return np.concatenate([table[name] for table in self.tables])
+
+    def points(self, index):
+        """Точки штриха как массив float32 поверх mmap (без копирования)."""
+        entry = self.entry(index)
+        return np.frombuffer(self.mm, "<f4", int(entry["count"]), int(entry["offset"]))
+
+
+def open_recovered(path):
+    """Открывает рисунок, сначала отрезав недописанный после сбоя сегмент в конце файла."""
+    drawing = DrawingFile(path)
+    if drawing.end < drawing.size:
+        end = drawing.end
+        drawing.close()  # файл, отображённый через mmap, нельзя укорачивать
+        with open(path, "r+b") as f:
+            f.truncate(end)
+        drawing = DrawingFile(path)
+    return drawing
+
+
+class DrawingWriter:
+    """Дописывает в файл новые штрихи сегментами и правит флаги уже записанных на месте."""
+
+    def __init__(self, path, drawing=None):
+        """drawing — DrawingFile того же файла из open_recovered: дописываем после него; без него файл создаётся заново."""
+        self.path = path
+        self.entries = array("Q")  # индекс штриха в документе -> смещение его записи в файле
+        self.flags = array("B")    # флаги в том виде, в каком они записаны
+        self.count = 0
+        if drawing is None:
+            self.file = open(path, "w+b")
+            self.reset()
+            return
+        if drawing.end != drawing.size:
+            raise ValueError(f"{path}: open the drawing with open_recovered before appending")
+        self.file = open(path, "r+b")
+        self.entries = array("Q", drawing.entry_offsets().tobytes())
+        self.flags = array("B", drawing.column("flags").tobytes())
+        self.count = len(drawing)
+        # Счётчик в заголовке мог отстать, если сбой случился между сегментом и заголовком
+        self.file.write(HEADER.pack(MAGIC, VERSION, ENTRY.itemsize, self.count))
+        self.file.flush()
+
+    def reset(self):
+        """Начинает файл заново (документ очищен)."""
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(HEADER.pack(MAGIC, VERSION, ENTRY.itemsize, 0))
+        self.file.flush()
+        self.entries = array("Q")
+        self.flags = array("B")
+        self.count = 0
+
+    def sync(self, document):
+        written = len(self.entries)
+        if document.flags[:written] != self.flags:
+            for i in range(written):
+                if document.flags[i] != self.flags[i]:
+                    self.file.seek(self.entries[i] + FLAGS_OFFSET)
+                    self.file.write(bytes((document.flags[i],)))
+                    self.flags[i] = document.flags[i]
+        if len(document) > written:
+            self._append(document, range(written, len(document)))
+        self.file.flush()
+
+    def _append(self, document, indices):
+        n = len(indices)
+        table = np.zeros(n, dtype=ENTRY)
+        self.file.seek(0, os.SEEK_END)
+        table_at = self.file.tell() + SEGMENT.size
+        point_at = table_at + n * ENTRY.itemsize
+        chunks = []
+        for row, i in enumerate(indices):
+            points = document.stroke_points(i)
+            entry = table[row]
+            entry["shape"] = document.shapes[i]
+            entry["flags"] = document.flags[i]
+            entry["color"] = document.color(i)
+            entry["width"] = document.widths[i]
+            entry["size"] = document.sizes[i]
+            entry["bbox"] = stroke_box(document.shape(i), points, document.sizes[i], document.widths[i])
+            entry["offset"] = point_at
+            entry["count"] = len(points)
+            point_at += len(points) * 4
+            chunks.append(points.tobytes())
+        points = b"".join(chunks)
+        self.file.write(SEGMENT.pack(SEGMENT_TAG, n, len(points)))
+        self.file.write(table.tobytes())
+        self.file.write(points)
+        self.entries.extend(table_at + row * ENTRY.itemsize for row in range(n))
+        self.flags.extend(document.flags[i] for i in indices)
+        self.count += n
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, ENTRY.itemsize, self.count))
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,36 @@
+from array import array
+
+from kivy.graphics import Color, InstructionGroup, Line
+
+# Точка ближе этого расстояния (в пикселях) к предыдущей отбрасывается сразу
+MIN_DISTANCE = 2.0
+
+
+class FreehandStroke:
+    """Буфер одного касания: точки копятся в array, Line обновляется не чаще раза за кадр."""
+
+    __slots__ = ("points", "group", "line", "dirty")
+
+    def __init__(self, x, y, color, width):
+        self.points = array("f", (x, y))
+        self.line = Line(points=[x, y], width=width)
+        self.group = InstructionGroup()
+        self.group.add(Color(*color))
+        self.group.add(self.line)
+        self.dirty = False
+
+    def append(self, x, y):
+        points = self.points
+        dx = x - points[-2]
+        dy = y - points[-1]
+        if dx * dx + dy * dy < MIN_DISTANCE * MIN_DISTANCE:
+            return False
+        points.append(x)
+        points.append(y)
+        self.dirty = True
+        return True
+
+    def sync(self):
+        if self.dirty:
+            self.line.points = self.points.tolist()
+            self.dirty = False
@@ -0,0 +1,125 @@
+from array import array
+import math
+
+import numpy as np
+
+# dtype numpy того же размера, что элемент array("L") на этой платформе
+INDEX_DTYPE = np.dtype(f"u{array('L').itemsize}")
+
+
+class SpatialGrid:
+    """Равномерная сетка над bbox штрихов для быстрого поиска под курсором."""
+
+    __slots__ = ("cell_size", "cells", "boxes")
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}            # (cx, cy) -> array индексов штрихов
+        self.boxes = array("f")    # x0, y0, x1, y1 на каждый штрих
+
+    def __len__(self):
+        return len(self.boxes) // 4
+
+    def _cell_range(self, x0, y0, x1, y1):
+        cs = self.cell_size
+        return (math.floor(x0 / cs), math.floor(y0 / cs),
+                math.floor(x1 / cs), math.floor(y1 / cs))
+
+    def insert(self, index, box):
+        """Добавляет штрих с индексом index (индексы идут подряд, как в документе)."""
+        if index != len(self):
+            raise ValueError("strokes must be inserted in document order")
+        self.boxes.extend(box)
+        cx0, cy0, cx1, cy1 = self._cell_range(*box)
+        cells = self.cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[(cx, cy)] = array("L", [index])
+                else:
+                    bucket.append(index)
+
+    def extend(self, boxes):
+        """Массовая вставка bbox (массив n×4) штрихов len(self), len(self) + 1, ... — для загрузки файла."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        first = len(self)
+        self.boxes.frombytes(boxes.tobytes())
+        if not len(boxes):
+            return
+        cells = np.floor(boxes / self.cell_size).astype(np.int64)
+        nx = cells[:, 2] - cells[:, 0] + 1
+        ny = cells[:, 3] - cells[:, 1] + 1
+        per_box = nx * ny
+        # Пары (клетка, штрих) для всех клеток, которые накрывает каждый bbox
+        owner = np.repeat(np.arange(len(boxes)), per_box)
+        step = np.arange(len(owner)) - np.repeat(np.cumsum(per_box) - per_box, per_box)
+        cx = cells[owner, 0] + step // ny[owner]
+        cy = cells[owner, 1] + step % ny[owner]
+        # Один ключ на клетку; устойчивая сортировка сохраняет порядок штрихов внутри клетки
+        key = (cx - cx.min()) * (int(cy.max() - cy.min()) + 1) + (cy - cy.min())
+        order = np.argsort(key, kind="stable")
+        key, cx, cy, owner = key[order], cx[order], cy[order], (owner[order] + first).astype(INDEX_DTYPE)
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        ends = np.r_[starts[1:], len(owner)]
+        grid = self.cells
+        for start, end, key in zip(starts.tolist(), ends.tolist(), zip(cx[starts].tolist(), cy[starts].tolist())):
+            bucket = grid.get(key)
+            if bucket is None:
+                bucket = grid[key] = array("L")
+            bucket.frombytes(owner[start:end].tobytes())
+
+    def query(self, x, y, radius=0.0):
+        """Индексы штрихов, чей bbox пересекает квадрат вокруг точки (по возрастанию)."""
+        x0, y0, x1, y1 = x - radius, y - radius, x + radius, y + radius
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        boxes = self.boxes
+        found = set()
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for i in self.cells.get((cx, cy), ()):
+                    if i in found:
+                        continue
+                    j = i * 4
+                    if boxes[j] <= x1 and boxes[j + 2] >= x0 and boxes[j + 1] <= y1 and boxes[j + 3] >= y0:
+                        found.add(i)
+        return sorted(found)
+
+    def strokes_in(self, x0, y0, x1, y1):
+        """Индексы штрихов, чей bbox пересекает большой прямоугольник (окно): один проход numpy по всем bbox."""
+        boxes = np.frombuffer(self.boxes, dtype=np.float32).reshape(-1, 4)
+        mask = (boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0)
+        return np.flatnonzero(mask).tolist()
+
+    def clear(self):
+        self.cells.clear()
+        del self.boxes[:]
+
+
+def stroke_box(shape, points, size, width):
+    """Ограничивающий прямоугольник штриха с учётом толщины линии."""
+    pad = width / 2
+    if shape in ("line", "bezier", "freehand"):
+        xs = points[0::2]
+        ys = points[1::2]
+        return min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+    # star/triangle/rounded_rectangle строятся вокруг точки касания в пределах size
+    x, y = points[0], points[1]
+    return x - size - pad, y - size - pad, x + size + pad, y + size + pad
+
+
+def segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def polyline_hit(points, x, y, radius):
+    for i in range(0, len(points) - 2, 2):
+        if segment_distance(x, y, points[i], points[i + 1], points[i + 2], points[i + 3]) <= radius:
+            return True
+    return False
+
@@ -0,0 +1,61 @@
+from kivy.graphics import ClearBuffers, ClearColor, Color, Fbo, InstructionGroup, Rectangle, Translate
+
+# Сколько штрихов запекается в одну текстуру
+LAYER_CAPACITY = 2048
+
+
+class FboLayer:
+    """Слой-текстура: Fbo перерисовывает свои штрихи только когда один из них изменился."""
+
+    __slots__ = ("fbo", "translate", "rect", "count")
+
+    def __init__(self, pos, size):
+        self.fbo = Fbo(size=size)
+        with self.fbo:
+            ClearColor(0, 0, 0, 0)
+            ClearBuffers()
+            self.translate = Translate(-pos[0], -pos[1])
+        self.rect = Rectangle(texture=self.fbo.texture, pos=pos, size=size)
+        self.count = 0
+
+    def resize(self, pos, size):
+        self.fbo.size = size
+        self.translate.xy = (-pos[0], -pos[1])
+        self.rect.texture = self.fbo.texture
+        self.rect.pos = pos
+        self.rect.size = size
+
+
+class LayerStack:
+    """Стопка Fbo-слоёв под живыми штрихами виджета."""
+
+    def __init__(self, canvas, capacity=LAYER_CAPACITY):
+        self.capacity = capacity
+        self.layers = []
+        self.pos = (0, 0)
+        self.size = (100, 100)
+        self.group = InstructionGroup()
+        self.group.add(Color(1, 1, 1, 1))
+        canvas.add(self.group)
+
+    def add(self, stroke_group):
+        if not self.layers or self.layers[-1].count >= self.capacity:
+            layer = FboLayer(self.pos, self.size)
+            self.layers.append(layer)
+            self.group.add(layer.fbo)
+            self.group.add(layer.rect)
+        layer = self.layers[-1]
+        layer.fbo.add(stroke_group)
+        layer.count += 1
+
+    def resize(self, pos, size):
+        self.pos = tuple(pos)
+        self.size = tuple(size)
+        for layer in self.layers:
+            layer.resize(self.pos, self.size)
+
+    def clear(self):
+        for layer in self.layers:
+            self.group.remove(layer.fbo)
+            self.group.remove(layer.rect)
+        self.layers.clear()
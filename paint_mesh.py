@@ -0,0 +1,89 @@
+from array import array
+
+from kivy.graphics import Color, InstructionGroup, Mesh
+import numpy as np
+
+# Индексы Mesh — unsigned short, поэтому в одном буфере не больше 65535 вершин
+MAX_VERTICES = 65535 // 3 * 3
+
+
+class MeshChunk:
+    __slots__ = ("vertices", "indices", "mesh", "dirty")
+
+    def __init__(self, group, color):
+        self.vertices = array("f")  # x, y, u, v
+        self.indices = array("H")
+        self.mesh = Mesh(mode="triangles")
+        self.dirty = False
+        # Свой Color у каждого чанка: переполненный цвет продолжается новым чанком в конце группы,
+        # после чужих Color
+        group.add(Color(*color))
+        group.add(self.mesh)
+
+    @property
+    def free(self):
+        return MAX_VERTICES - len(self.indices)
+
+    def upload(self):
+        self.mesh.vertices = self.vertices
+        self.mesh.indices = self.indices
+        self.dirty = False
+
+
+class MeshRenderer:
+    """Пакетная отрисовка: готовые фигуры складываются в несколько больших Mesh по цветам."""
+
+    def __init__(self):
+        self.group = InstructionGroup()
+        self.chunks = {}   # цвет -> список MeshChunk, последний дописывается
+        self.pieces = {}   # индекс штриха -> [(chunk, start, end), ...] в индексах чанка
+
+    def chunk_for(self, color):
+        chunks = self.chunks.get(color)
+        if chunks is None:
+            chunks = self.chunks[color] = []
+        if not chunks or chunks[-1].free < 3:
+            chunks.append(MeshChunk(self.group, color))
+        return chunks[-1]
+
+    def add(self, index, parts):
+        """parts — список (цвет, треугольники (n, 2)) одного штриха; отрисовываются не обязательно все штрихи."""
+        pieces = []
+        for color, triangles in parts:
+            color = tuple(color)
+            # x, y из треугольников + нулевые u, v одним куском float32
+            vertices = np.zeros((len(triangles), 4), dtype=np.float32)
+            vertices[:, :2] = triangles
+            done = 0
+            total = len(triangles)
+            while done < total:
+                chunk = self.chunk_for(color)
+                count = min(chunk.free, total - done)
+                first = len(chunk.indices)
+                chunk.vertices.frombytes(vertices[done:done + count].tobytes())
+                chunk.indices.extend(range(first, first + count))
+                chunk.dirty = True
+                pieces.append((chunk, first, first + count))
+                done += count
+        self.pieces[index] = pieces
+
+    def set_visible(self, indices, visible):
+        # Скрытый штрих превращается в вырожденные треугольники, буфер не пересобирается
+        for i in indices:
+            for chunk, start, end in self.pieces.get(i, ()):
+                if visible:
+                    chunk.indices[start:end] = array("H", range(start, end))
+                else:
+                    chunk.indices[start:end] = array("H", bytes(2 * (end - start)))
+                chunk.dirty = True
+
+    def flush(self, *args):
+        for chunks in self.chunks.values():
+            for chunk in chunks:
+                if chunk.dirty:
+                    chunk.upload()
+
+    def clear(self):
+        self.group.clear()
+        self.chunks.clear()
+        self.pieces.clear()
@@ -0,0 +1,135 @@
+from functools import lru_cache
+from math import comb, ceil, sqrt, pi
+
+import numpy as np
+
+# Допустимое отклонение ломаной от кривой в пикселях
+TOLERANCE = 0.5
+MAX_SEGMENTS = 256
+
+
+@lru_cache(maxsize=512)
+def bernstein_basis(degree, segments):
+    """Матрица (segments + 1, degree + 1) базисных полиномов Бернштейна."""
+    t = np.linspace(0.0, 1.0, segments + 1)[:, None]
+    k = np.arange(degree + 1)[None, :]
+    coeffs = np.array([comb(degree, i) for i in range(degree + 1)], dtype=float)[None, :]
+    basis = coeffs * t ** k * (1.0 - t) ** (degree - k)
+    basis.flags.writeable = False
+    return basis
+
+
+def segment_count(control, tolerance=TOLERANCE):
+    """Число отрезков, при котором ломаная отходит от кривой не больше чем на tolerance."""
+    degree = len(control) - 1
+    if degree < 2:
+        return 1
+    second = control[:-2] - 2 * control[1:-1] + control[2:]
+    bound = degree * (degree - 1) * np.sqrt((second ** 2).sum(axis=1)).max()
+    return max(2, min(MAX_SEGMENTS, ceil(sqrt(bound / (8 * tolerance)))))
+
+
+def tessellate(control_points, tolerance=TOLERANCE):
+    """Кривая Безье любой степени по плоскому списку x0, y0, x1, y1, ... -> плоский список точек."""
+    control = np.asarray(control_points, dtype=float).reshape(-1, 2)
+    degree = len(control) - 1
+    if degree < 2:
+        return control.ravel().tolist()
+    basis = bernstein_basis(degree, segment_count(control, tolerance))
+    return (basis @ control).ravel().tolist()
+
+
+@lru_cache(maxsize=None)
+def star_template():
+    angles = np.arange(10) * (pi / 5)
+    radius = np.where(np.arange(10) % 2 == 0, 1.0, 0.5)
+    template = np.column_stack((radius * np.cos(angles), radius * np.sin(angles)))
+    template.flags.writeable = False
+    return template
+
+
+@lru_cache(maxsize=None)
+def triangle_template():
+    template = np.array([[0.0, 1.0], [-0.5, -0.5], [0.5, -0.5]])
+    template.flags.writeable = False
+    return template
+
+
+def place(template, x, y, size):
+    """Масштабирует и переносит единичный шаблон фигуры."""
+    return (template * size + (x, y)).ravel().tolist()
+
+
+def polyline_triangles(points, width, closed=False):
+    """Треугольники толстой ломаной: по прямоугольнику на отрезок (как у Line, width — полутолщина)."""
+    p = np.asarray(points, dtype=float).reshape(-1, 2)
+    if closed:
+        p = np.vstack((p, p[:1]))
+    a, b = p[:-1], p[1:]
+    d = b - a
+    length = np.hypot(d[:, 0], d[:, 1])
+    length[length == 0] = 1.0
+    d *= (width / length)[:, None]
+    n = np.column_stack((-d[:, 1], d[:, 0]))
+    # Квадратные концы перекрывают стыки соседних отрезков
+    a = a - d
+    b = b + d
+    return np.stack((a + n, a - n, b - n, a + n, b - n, b + n), axis=1).reshape(-1, 2)
+
+
+def fan_triangles(outline):
+    """Треугольники выпуклого многоугольника веером из центра."""
+    o = np.asarray(outline, dtype=float).reshape(-1, 2)
+    center = np.broadcast_to(o.mean(axis=0), o.shape)
+    return np.stack((center, o, np.roll(o, -1, axis=0)), axis=1).reshape(-1, 2)
+
+
+@lru_cache(maxsize=None)
+def quarter_arc(steps=4):
+    angles = np.linspace(0.0, pi / 2, steps + 1)
+    arc = np.column_stack((np.cos(angles), np.sin(angles)))
+    arc.flags.writeable = False
+    return arc
+
+
+def rounded_rect_outline(x, y, w, h, radius):
+    arc = quarter_arc() * radius
+    corners = ((x + w - radius, y + h - radius), (x + radius, y + h - radius),
+               (x + radius, y + radius), (x + w - radius, y + radius))
+    parts = []
+    for quarter, corner in enumerate(corners):
+        # Поворот дуги на quarter * 90 градусов
+        c = arc
+        for _ in range(quarter):
+            c = np.column_stack((-c[:, 1], c[:, 0]))
+        parts.append(c + corner)
+    return np.concatenate(parts)
+
+
+def simplify(points, tolerance=1.0):
+    """Упрощение ломаной методом Рамера — Дугласа — Пекера (без рекурсии)."""
+    p = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(p) < 3:
+        return p.ravel().tolist()
+    keep = np.zeros(len(p), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(p) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a, b = p[first], p[last]
+        d = b - a
+        inner = p[first + 1:last] - a
+        length = np.hypot(d[0], d[1])
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(inner[:, 0] * d[1] - inner[:, 1] * d[0]) / length
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            mid = first + 1 + i
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return p[keep].ravel().tolist()
@@ -0,0 +1,245 @@
+from functools import lru_cache
+import random
+import threading
+import time
+
+from ttt_engine import X, O
+
+WIN_SCORE = 1000000
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_LIMIT = 1 << 20  # Таблица очищается целиком, когда в ней столько позиций
+CHECK_EVERY = 127  # Проверка времени раз в 128 узлов
+SMALL_BOARD = 4  # На полях больше — только клетки рядом с занятыми
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def symmetries(side):
+    """8 перестановок клеток квадратного поля: повороты и отражения."""
+    last = side - 1
+    transforms = (
+        lambda r, c: (r, c), lambda r, c: (c, last - r), lambda r, c: (last - r, last - c),
+        lambda r, c: (last - c, r), lambda r, c: (r, last - c), lambda r, c: (last - r, c),
+        lambda r, c: (c, r), lambda r, c: (last - c, last - r),
+    )
+    perms = []
+    for transform in transforms:
+        perm = [0] * (side * side)
+        for cell in range(side * side):
+            row, col = transform(*divmod(cell, side))
+            perm[cell] = row * side + col
+        perms.append(tuple(perm))
+    return tuple(perms)
+
+
+class SearchTables:
+    """Ключи Zobrist для каждой симметрии и маски соседства для одной геометрии поля."""
+
+    __slots__ = ("geometry", "perms", "inverse", "keys", "not_first_col", "not_last_col", "center")
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        side, cells = geometry.side, geometry.cells
+        self.perms = symmetries(side)
+        self.inverse = tuple(tuple(sorted(range(cells), key=perm.__getitem__)) for perm in self.perms)
+        rng = random.Random(side * 1000 + geometry.k)  # Одинаковые ключи от запуска к запуску
+        zobrist = [[rng.getrandbits(64) for _ in range(cells)] for _ in (X, O)]
+        # keys[s][player][cell] — ключ клетки в позиции, повёрнутой симметрией s
+        self.keys = tuple(tuple(tuple(zobrist[player][perm[cell]] for cell in range(cells)) for player in (X, O))
+                          for perm in self.perms)
+        first_col = sum(1 << (row * side) for row in range(side))
+        self.not_first_col = geometry.full & ~first_col
+        self.not_last_col = geometry.full & ~(first_col << (side - 1))
+        middle = (side - 1) / 2
+        self.center = tuple(sorted(range(cells), key=lambda cell: abs(cell // side - middle) + abs(cell % side - middle)))
+
+    def hashes(self, board):
+        hashes = []
+        for keys in self.keys:
+            h = 0
+            for player in (X, O):
+                bits = board.bits[player]
+                while bits:
+                    low = bits & -bits
+                    h ^= keys[player][low.bit_length() - 1]
+                    bits ^= low
+            hashes.append(h)
+        return hashes
+
+    def neighbours(self, bits):
+        """Клетки на расстоянии не больше 1 от занятых (сдвиги битовой доски)."""
+        side = self.geometry.side
+        row = bits | (bits << 1) & self.not_first_col | (bits >> 1) & self.not_last_col
+        return (row | row << side | row >> side) & self.geometry.full
+
+
+@lru_cache(maxsize=8)
+def search_tables(geometry):
+    return SearchTables(geometry)
+
+
+class Searcher:
+    """Альфа-бета (negamax) с таблицей транспозиций по каноническому ключу среди 8 симметрий."""
+
+    def __init__(self, tables, tt=None):
+        self.tables = tables
+        self.tt = {} if tt is None else tt
+        self.history = [0] * tables.geometry.cells
+        k = tables.geometry.k
+        self.weights = [0] + [4 ** count for count in range(1, k + 1)]
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None
+
+    def best_move(self, board, time_budget=1.0, stop=None, max_depth=None):
+        """Итеративное углубление до исчерпания времени; возвращает (клетка, оценка, глубина)."""
+        self.deadline = time.monotonic() + time_budget
+        self.stop = stop
+        self.nodes = 0
+        board = board.copy()
+        free = board.free()
+        if not board.moves:
+            return self.tables.center[0], 0, 0
+        max_depth = min(max_depth or free.bit_count(), free.bit_count())
+        hashes = self.tables.hashes(board)
+        # Запасной ход, если не успеем закончить даже глубину 1
+        best = self.candidates(board, None)[0], 0, 0
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self.search(board, hashes, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0)
+            except SearchTimeout:
+                break
+            best = move, score, depth
+            if abs(score) >= WIN_SCORE - depth:
+                break  # Исход уже известен точно
+        return best
+
+    def candidates(self, board, tt_move):
+        tables = self.tables
+        free = board.free()
+        if tables.geometry.side > SMALL_BOARD:
+            free &= tables.neighbours(board.bits[X] | board.bits[O]) or free
+            moves = []
+            while free:
+                low = free & -free
+                moves.append(low.bit_length() - 1)
+                free ^= low
+            moves.sort(key=self.history.__getitem__, reverse=True)
+        else:
+            moves = [cell for cell in tables.center if free >> cell & 1]
+        if tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def evaluate(self, board):
+        """Оценка для ходящего: открытые отрезки длины k, взвешенные по числу своих камней."""
+        mine, theirs = board.bits[board.turn], board.bits[board.turn ^ 1]
+        weights = self.weights
+        score = 0
+        for mask in board.geometry.win_masks:
+            a = mine & mask
+            b = theirs & mask
+            if a:
+                if not b:
+                    score += weights[a.bit_count()]
+            elif b:
+                score -= weights[b.bit_count()]
+        return score
+
+    def search(self, board, hashes, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & CHECK_EVERY:
+            if time.monotonic() > self.deadline or (self.stop is not None and self.stop.is_set()):
+                raise SearchTimeout
+        if board.moves == board.geometry.cells:
+            return 0, None
+        if depth == 0:
+            return self.evaluate(board), None
+
+        tables = self.tables
+        key = min(hashes)
+        sym = hashes.index(key)
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, flag, score, stored = entry
+            tt_move = tables.inverse[sym][stored]
+            if entry_depth >= depth:
+                # Оценки выигрыша хранятся относительно позиции, а не корня
+                if score > WIN_SCORE // 2:
+                    score -= ply
+                elif score < -WIN_SCORE // 2:
+                    score += ply
+                if flag == EXACT or (flag == LOWER and score >= beta) or (flag == UPPER and score <= alpha):
+                    return score, tt_move
+
+        original_alpha = alpha
+        player = board.turn
+        best_score, best_move = -WIN_SCORE - 1, None
+        for cell in self.candidates(board, tt_move):
+            # Доска — копия из best_move, поэтому при SearchTimeout её не нужно откатывать
+            if board.play(cell):
+                score = WIN_SCORE - ply - 1
+            else:
+                child = [h ^ keys[player][cell] for h, keys in zip(hashes, tables.keys)]
+                score = -self.search(board, child, depth - 1, -beta, -alpha, ply + 1)[0]
+            board.undo(cell)
+            if score > best_score:
+                best_score, best_move = score, cell
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self.history[cell] += depth * depth
+                        break
+
+        if len(self.tt) >= TT_LIMIT:
+            self.tt.clear()
+        flag = UPPER if best_score <= original_alpha else LOWER if best_score >= beta else EXACT
+        stored_score = best_score
+        if stored_score > WIN_SCORE // 2:
+            stored_score += ply
+        elif stored_score < -WIN_SCORE // 2:
+            stored_score -= ply
+        self.tt[key] = (depth, flag, stored_score, tables.perms[sym][best_move])
+        return best_score, best_move
+
+
+class AiPlayer:
+    """Компьютерный игрок: поиск в фоновом потоке, чтобы UI и анимации не замирали."""
+
+    def __init__(self, time_budget=1.0):
+        self.time_budget = time_budget
+        self.tables = None
+        self.tt = {}  # Общая для всех ходов партии
+        self.stop = None
+
+    def reset(self):
+        """Новая партия: таблица транспозиций больше не нужна."""
+        self.cancel()
+        self.tt = {}
+
+    def start(self, board, on_move):
+        """Запускает поиск по копии board; on_move(cell) вызывается из рабочего потока."""
+        self.cancel()
+        tables = search_tables(board.geometry)
+        if tables is not self.tables:
+            self.tables, self.tt = tables, {}
+        # Отменённый поиск может ещё доделывать свои 128 узлов, поэтому у каждого запуска свой Searcher
+        searcher = Searcher(tables, self.tt)
+        stop = self.stop = threading.Event()
+        board = board.copy()
+
+        def run():
+            move = searcher.best_move(board, self.time_budget, stop)[0]
+            if not stop.is_set():
+                on_move(move)
+
+        threading.Thread(target=run, name="ttt-ai", daemon=True).start()
+
+    def cancel(self):
+        if self.stop is not None:
+            self.stop.set()
+            self.stop = None
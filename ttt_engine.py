@@ -0,0 +1,142 @@
+from functools import lru_cache
+
+X, O = 0, 1
+MARKS = ("X", "O")
+
+# Направления линий через клетку: по строке, по столбцу и две диагонали
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class Geometry:
+    """Выигрышные маски поля side×side для k в ряд; клетка row * side + col — бит с тем же номером."""
+
+    __slots__ = ("side", "k", "cells", "full", "win_masks", "cell_wins")
+
+    def __init__(self, side, k):
+        if not 1 <= k <= side:
+            raise ValueError(f"k must be between 1 and {side}")
+        self.side = side
+        self.k = k
+        self.cells = side * side
+        self.full = (1 << self.cells) - 1
+        masks = []
+        for row in range(side):
+            for col in range(side):
+                for dr, dc in DIRECTIONS:
+                    end_row, end_col = row + dr * (k - 1), col + dc * (k - 1)
+                    if 0 <= end_row < side and 0 <= end_col < side:
+                        masks.append(sum(1 << ((row + dr * i) * side + col + dc * i) for i in range(k)))
+        self.win_masks = tuple(masks)
+        # Для каждой клетки — отрезки длины k через неё (не больше 4k): после хода проверяются только они,
+        # так что цена хода не зависит от размера поля
+        cell_wins = [[] for _ in range(self.cells)]
+        for mask in masks:
+            bits = mask
+            while bits:
+                low = bits & -bits
+                cell_wins[low.bit_length() - 1].append(mask)
+                bits ^= low
+        self.cell_wins = tuple(map(tuple, cell_wins))
+
+
+@lru_cache(maxsize=None)
+def geometry(side, k):
+    return Geometry(side, k)
+
+
+class Board:
+    """Позиция «k в ряд» на поле side×side: по битовой доске на игрока, без виджетов."""
+
+    __slots__ = ("geometry", "bits", "turn", "moves", "winner")
+
+    def __init__(self, side=3, k=3):
+        self.geometry = geometry(side, k)
+        self.bits = [0, 0]
+        self.turn = X
+        self.moves = 0
+        self.winner = None
+
+    @property
+    def side(self):
+        return self.geometry.side
+
+    @property
+    def k(self):
+        return self.geometry.k
+
+    @property
+    def cells(self):
+        return self.geometry.cells
+
+    def reset(self):
+        self.bits[X] = self.bits[O] = 0
+        self.turn = X
+        self.moves = 0
+        self.winner = None
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.geometry = self.geometry
+        board.bits = list(self.bits)
+        board.turn = self.turn
+        board.moves = self.moves
+        board.winner = self.winner
+        return board
+
+    def free(self):
+        """Маска свободных клеток."""
+        return self.geometry.full & ~(self.bits[X] | self.bits[O])
+
+    def legal_moves(self):
+        if self.winner is not None:
+            return []
+        free = self.free()
+        return [cell for cell in range(self.geometry.cells) if free >> cell & 1]
+
+    def mark(self, cell):
+        """Символ в клетке: "X", "O" или пустая строка."""
+        if self.bits[X] >> cell & 1:
+            return MARKS[X]
+        if self.bits[O] >> cell & 1:
+            return MARKS[O]
+        return ""
+
+    def is_over(self):
+        return self.winner is not None or self.moves == self.geometry.cells
+
+    def play(self, cell):
+        """Ход текущего игрока; возвращает True, если он выиграл."""
+        player = self.turn
+        bits = self.bits[player] | 1 << cell
+        self.bits[player] = bits
+        self.moves += 1
+        self.turn = player ^ 1
+        for mask in self.geometry.cell_wins[cell]:
+            if bits & mask == mask:
+                self.winner = player
+                return True
+        return False
+
+    def undo(self, cell):
+        """Отменяет последний ход (в клетку cell) — для перебора в поиске."""
+        player = self.turn ^ 1
+        self.bits[player] &= ~(1 << cell)
+        self.moves -= 1
+        self.turn = player
+        self.winner = None
+
+
+def count_games(board):
+    """Число различных партий из позиции (из пустой доски 3×3 — 255168); проверка и замер движка."""
+    if board.winner is not None or board.moves == board.cells:
+        return 1
+    total = 0
+    free = board.free()
+    while free:
+        low = free & -free
+        cell = low.bit_length() - 1
+        board.play(cell)
+        total += count_games(board)
+        board.undo(cell)
+        free ^= low
+    return total
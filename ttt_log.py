@@ -0,0 +1,128 @@
+from array import array
+import mmap
+import struct
+import sys
+
+from ttt_engine import Board, O, X
+
+# Файл сессии: заголовок файла, затем партии подряд — заголовок партии и по клетке на ход
+# (1 байт, если клеток не больше 256, иначе 2 байта little-endian)
+MAGIC = b"TTTL"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sH")
+GAME_HEADER = struct.Struct("<BBBH")  # сторона, k, результат, число ходов
+DRAW, UNFINISHED = 2, 3  # Результаты помимо X и O (победитель)
+SNAPSHOT_EVERY = 8  # Снимок позиции в Replay раз в столько ходов
+
+
+def move_typecode(side):
+    return "B" if side * side <= 256 else "H"
+
+
+def pack_game(side, k, result, moves):
+    body = array(move_typecode(side), moves)
+    if body.itemsize > 1 and sys.byteorder == "big":
+        body.byteswap()
+    return GAME_HEADER.pack(side, k, result, len(body)) + body.tobytes()
+
+
+def append_game(path, side, k, result, moves):
+    """Дописывает партию в конец файла сессии (создаёт файл при первой записи)."""
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(FILE_HEADER.pack(MAGIC, VERSION))
+        f.write(pack_game(side, k, result, moves))
+
+
+class GameArchive:
+    """Архив партий через mmap: scan() идёт только по заголовкам, ходы читаются по запросу."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = None
+        size = self.file.seek(0, 2)
+        if size == 0:
+            return
+        if size < FILE_HEADER.size:
+            self.file.close()
+            raise ValueError(f"{path}: truncated header")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a game log")
+
+    def scan(self):
+        """Заголовки партий: (смещение, сторона, k, результат, число ходов); недописанный хвост пропускается."""
+        data = self.map
+        if data is None:
+            return
+        offset, end = FILE_HEADER.size, len(data)
+        unpack = GAME_HEADER.unpack_from
+        while offset + GAME_HEADER.size <= end:
+            side, k, result, count = unpack(data, offset)
+            size = GAME_HEADER.size + (count if side * side <= 256 else 2 * count)
+            if offset + size > end:
+                break
+            yield offset, side, k, result, count
+            offset += size
+
+    def moves(self, offset):
+        side, k, result, count = GAME_HEADER.unpack_from(self.map, offset)
+        moves = array(move_typecode(side))
+        start = offset + GAME_HEADER.size
+        moves.frombytes(self.map[start:start + count * moves.itemsize])
+        if moves.itemsize > 1 and sys.byteorder == "big":
+            moves.byteswap()
+        return moves
+
+    def replay(self, offset):
+        side, k, result, count = GAME_HEADER.unpack_from(self.map, offset)
+        return Replay(side, k, result, self.moves(offset))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay:
+    """Партия для просмотра: снимки битовых досок раз в SNAPSHOT_EVERY ходов дают переход к любому ходу за O(1)."""
+
+    __slots__ = ("side", "k", "result", "moves", "snapshots")
+
+    def __init__(self, side, k, result, moves):
+        self.side = side
+        self.k = k
+        self.result = result
+        self.moves = moves
+        board = Board(side, k)
+        self.snapshots = [(0, 0)]
+        for ply, cell in enumerate(moves, 1):
+            board.play(cell)
+            if ply % SNAPSHOT_EVERY == 0:
+                self.snapshots.append((board.bits[X], board.bits[O]))
+
+    def __len__(self):
+        return len(self.moves)
+
+    def board_at(self, ply):
+        """Позиция после ply ходов: ближайший снимок и не больше SNAPSHOT_EVERY - 1 ходов сверху."""
+        ply = max(0, min(ply, len(self.moves)))
+        base = ply // SNAPSHOT_EVERY * SNAPSHOT_EVERY
+        board = Board(self.side, self.k)
+        board.bits[X], board.bits[O] = self.snapshots[base // SNAPSHOT_EVERY]
+        board.moves = base
+        board.turn = base & 1
+        for cell in self.moves[base:ply]:
+            board.play(cell)
+        if ply == len(self.moves) and self.result in (X, O):
+            board.winner = self.result
+        return board
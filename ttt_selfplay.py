@@ -0,0 +1,185 @@
+import argparse
+from array import array
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+from ttt_ai import Searcher, search_tables
+from ttt_engine import Board, O, X
+
+CHUNK_GAMES = 2000  # Партий в одной задаче пула
+TOLERANCE = 0.02  # Допустимое отклонение долей побед/ничьих от эталона
+# Индексы в массиве результатов
+X_WINS, O_WINS, DRAWS = 0, 1, 2
+
+
+class RandomStrategy:
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose(self, board):
+        cells = board.cells
+        free = board.free()
+        if board.moves < cells // 2:
+            # Пока поле в основном свободно, случайная клетка почти всегда подходит с первой попытки
+            while True:
+                cell = self.rng.randrange(cells)
+                if free >> cell & 1:
+                    return cell
+        return self.rng.choice(board.legal_moves())
+
+
+class HeuristicStrategy:
+    """Выиграть, если можно; иначе помешать выигрышу соперника; иначе ближе к центру."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose(self, board):
+        tables = search_tables(board.geometry)
+        free = board.free()
+        if board.side > 4 and board.moves:
+            free &= tables.neighbours(board.bits[X] | board.bits[O]) or free
+        cells = [cell for cell in tables.center if free >> cell & 1]
+        cell_wins = board.geometry.cell_wins
+        for player in (board.turn, board.turn ^ 1):
+            bits = board.bits[player]
+            for cell in cells:
+                grown = bits | 1 << cell
+                for mask in cell_wins[cell]:
+                    if grown & mask == mask:
+                        return cell
+        # Среди равноудалённых от центра клеток — случайная
+        return cells[0] if board.side <= 4 else self.rng.choice(cells[:8])
+
+
+class SearchStrategy:
+    def __init__(self, rng, depth=2, time_budget=10.0):
+        self.depth = depth
+        self.time_budget = time_budget
+        self.tt = {}  # Общая для всех партий процесса: позиции не зависят от партии
+        self.searchers = {}
+
+    def choose(self, board):
+        searcher = self.searchers.get(board.geometry)
+        if searcher is None:
+            searcher = self.searchers[board.geometry] = Searcher(search_tables(board.geometry), self.tt)
+        return searcher.best_move(board, self.time_budget, max_depth=self.depth)[0]
+
+
+STRATEGIES = {"random": RandomStrategy, "heuristic": HeuristicStrategy, "search": SearchStrategy}
+
+
+def make_strategy(spec, rng):
+    """random, heuristic или search[:глубина]."""
+    name, colon, depth = spec.partition(":")
+    if name not in STRATEGIES or colon and (name != "search" or not depth.isdigit()):
+        raise ValueError(f"unknown strategy {spec!r}")
+    if depth:
+        return STRATEGIES[name](rng, depth=int(depth))
+    return STRATEGIES[name](rng)
+
+
+def play_chunk(task):
+    """Партии одной задачи пула; возвращает только сводные счётчики, без записей партий."""
+    x_spec, o_spec, side, k, games, opening, seed = task
+    rng = random.Random(seed)
+    strategies = (make_strategy(x_spec, rng), make_strategy(o_spec, rng))
+    opener = RandomStrategy(rng)
+    board = Board(side, k)
+    results = array("Q", [0, 0, 0])
+    lengths = array("Q", bytes(8 * (board.cells + 1)))  # Гистограмма длины партий в ходах
+    start = time.process_time()
+    for _ in range(games):
+        board.reset()
+        while True:
+            strategy = opener if board.moves < opening else strategies[board.turn]
+            if board.play(strategy.choose(board)):
+                results[board.winner] += 1
+                break
+            if board.moves == board.cells:
+                results[DRAWS] += 1
+                break
+        lengths[board.moves] += 1
+    return results, lengths, time.process_time() - start
+
+
+def run_tournament(x_spec, o_spec, side=3, k=3, games=100000, opening=0, workers=None, seed=1):
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for index, start in enumerate(range(0, games, CHUNK_GAMES)):
+        tasks.append((x_spec, o_spec, side, k, min(CHUNK_GAMES, games - start), opening, seed * 1000003 + index))
+    results = array("Q", [0, 0, 0])
+    lengths = array("Q", bytes(8 * (side * side + 1)))
+    cpu_seconds = 0.0
+    wall_start = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for chunk_results, chunk_lengths, seconds in pool.imap_unordered(play_chunk, tasks):
+            for i, n in enumerate(chunk_results):
+                results[i] += n
+            for i, n in enumerate(chunk_lengths):
+                lengths[i] += n
+            cpu_seconds += seconds
+    wall = time.perf_counter() - wall_start
+    moves = sum(length * n for length, n in enumerate(lengths))
+    return {
+        "x": x_spec, "o": o_spec, "side": side, "k": k, "games": games, "opening": opening, "workers": workers,
+        "x_win_rate": results[X_WINS] / games, "o_win_rate": results[O_WINS] / games,
+        "draw_rate": results[DRAWS] / games,
+        "mean_length": moves / games,
+        "lengths": {length: n for length, n in enumerate(lengths) if n},
+        "games_per_second": games / wall,
+        "moves_per_second_per_core": moves / cpu_seconds if cpu_seconds else 0.0,
+        "wall_seconds": wall,
+    }
+
+
+def compare(result, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for name in ("x_win_rate", "o_win_rate", "draw_rate"):
+        if abs(result[name] - baseline[name]) > tolerance:
+            regressions.append(f"{name}: {baseline[name]:.4f} -> {result[name]:.4f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel self-play tournament for the lz5.py game engine")
+    parser.add_argument("--x", default="random", help="strategy for X: random, heuristic, search[:depth]")
+    parser.add_argument("--o", default="random", help="strategy for O")
+    parser.add_argument("--side", type=int, default=3)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--opening", type=int, default=0, help="random moves before the strategies take over")
+    parser.add_argument("--workers", type=int, default=None, help="default: all cores")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="selfplay_output.json")
+    parser.add_argument("--baseline", help="previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    result = run_tournament(args.x, args.o, args.side, args.k, args.games, args.opening, args.workers, args.seed)
+    result["meta"] = {"python": platform.python_version(), "machine": platform.machine(), "seed": args.seed}
+    print(f"{args.x} vs {args.o} on {args.side}x{args.side} (k={args.k}): {args.games} games  "
+          f"X {result['x_win_rate']:.1%}  O {result['o_win_rate']:.1%}  draw {result['draw_rate']:.1%}  "
+          f"mean length {result['mean_length']:.2f}")
+    print(f"{result['games_per_second']:.0f} games/s, {result['moves_per_second_per_core']:.0f} moves/s per core "
+          f"on {result['workers']} workers")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class ProfileCache:
+    """Ограниченный LRU-кеш профилей с временем жизни записей (TTL)."""
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()  # login -> (запись, момент устаревания)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, login):
+        with self._lock:
+            item = self._data.get(login)
+            if item is None:
+                self.misses += 1
+                return None
+            record, expires = item
+            if expires < time.monotonic():
+                del self._data[login]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(login)
+            self.hits += 1
+            return record
+
+    def put(self, login, record):
+        with self._lock:
+            self._data[login] = (record, time.monotonic() + self.ttl)
+            self._data.move_to_end(login)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations}
@@ -0,0 +1,222 @@
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+from itertools import islice
+
+COLUMNS = ("login", "password", "fio", "email", "phone")
+CHUNK_SIZE = 10000
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_RE = re.compile(r"^\+?[0-9()\- ]{5,20}$")
+# Экранирование для текстового формата COPY
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+INSERT_ROW = f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+
+
+class ImportStats:
+    __slots__ = ("imported", "rejected", "bytes_read", "bytes_total")
+
+    def __init__(self, bytes_total=0):
+        self.imported = 0
+        self.rejected = 0
+        self.bytes_read = 0
+        self.bytes_total = bytes_total
+
+    @property
+    def fraction(self):
+        return self.bytes_read / self.bytes_total if self.bytes_total else 1.0
+
+
+def read_lines(f, stats):
+    """Строки файла с подсчётом прочитанного объёма для прогресса (в байтах, как размер файла)."""
+    for line in f:
+        stats.bytes_read += len(line.encode("utf-8"))
+        yield line
+
+
+def read_records(path, stats):
+    """Записи файла CSV (с заголовком) или JSONL как словари, по одной."""
+    with open(path, encoding="utf-8", newline="") as f:
+        lines = read_lines(f, stats)
+        if path.endswith((".jsonl", ".ndjson")):
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    yield number, {"_error": str(e)}
+        else:
+            for number, record in enumerate(csv.DictReader(lines), 2):
+                yield number, record
+
+
+def check_record(record):
+    """Возвращает кортеж колонок или текст ошибки."""
+    if not isinstance(record, dict):
+        return "not an object"
+    if "_error" in record:
+        return record["_error"]
+    row = []
+    for column in COLUMNS:
+        value = record.get(column)
+        if isinstance(value, (dict, list)):
+            return f"bad {column}"
+        # В JSONL значения бывают числами (телефон) или null
+        row.append("" if value is None else str(value).strip())
+    row = tuple(row)
+    login, password, fio, email, phone = row
+    if not login or len(login) > 64:
+        return "bad login"
+    if not password:
+        return "empty password"
+    if email and not EMAIL_RE.match(email):
+        return "bad email"
+    if phone and not PHONE_RE.match(phone):
+        return "bad phone"
+    return row
+
+
+def valid_rows(records, rejects, stats):
+    """Генератор проверенных строк (номер строки файла, колонки); отброшенные пишутся в rejects (csv.writer)."""
+    for number, record in records:
+        row = check_record(record)
+        if isinstance(row, str):
+            stats.rejected += 1
+            rejects.writerow([number, row, json.dumps(record, ensure_ascii=False)])
+            continue
+        yield number, row
+
+
+def copy_chunk(connection, rows):
+    """Загрузка пачки строк через COPY (psycopg2)."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(value.translate(COPY_ESCAPES) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY users ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+
+
+def insert_chunk(connection, rows):
+    """Запасной путь: многострочный INSERT через execute_values."""
+    from psycopg2.extras import execute_values
+    with connection.cursor() as cursor:
+        execute_values(cursor, f"INSERT INTO users ({', '.join(COLUMNS)}) VALUES %s", rows, page_size=1000)
+
+
+class PostgresLoader:
+    """Каждая пачка — одна транзакция; если база отвергла строку, пачка повторяется по строкам."""
+
+    def __init__(self, connection, use_copy=True):
+        import psycopg2
+        self.connection = connection
+        self.use_copy = use_copy
+        self.row_errors = (psycopg2.IntegrityError, psycopg2.DataError)  # виновата строка, а не соединение
+        self.errors = psycopg2.Error
+
+    def load(self, rows):
+        """Возвращает отклонённые базой строки: [(позиция в rows, причина), ...]."""
+        if self.use_copy:
+            try:
+                self.in_transaction(copy_chunk, rows)
+                return []
+            except self.row_errors:
+                return self.load_rows(rows)
+            except self.errors as e:
+                # COPY недоступен (нет прав, пулер соединений) — до конца импорта через execute_values
+                print(f"COPY failed, falling back to INSERT: {e}")
+                self.use_copy = False
+        try:
+            self.in_transaction(insert_chunk, rows)
+            return []
+        except self.row_errors:
+            return self.load_rows(rows)
+
+    def in_transaction(self, load, rows):
+        # Соединения пула в autocommit: без BEGIN execute_values фиксировал бы каждую страницу отдельно
+        with self.connection.cursor() as cursor:
+            cursor.execute("BEGIN")
+            try:
+                load(self.connection, rows)
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def load_rows(self, rows):
+        rejected = []
+        with self.connection.cursor() as cursor:
+            cursor.execute("BEGIN")
+            try:
+                for position, row in enumerate(rows):
+                    cursor.execute("SAVEPOINT row")
+                    try:
+                        cursor.execute(INSERT_ROW, row)
+                    except self.row_errors as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT row")
+                        rejected.append((position, str(e).strip()))
+                    else:
+                        cursor.execute("RELEASE SAVEPOINT row")
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        return rejected
+
+
+class SqliteLoader:
+    def __init__(self, connection):
+        self.connection = connection
+        self.sql = INSERT_ROW.replace("%s", "?")
+
+    def load(self, rows):
+        try:
+            with self.connection:
+                self.connection.executemany(self.sql, rows)
+            return []
+        except sqlite3.IntegrityError:
+            pass
+        # В SQLite ошибка откатывает только свой INSERT, транзакция пачки продолжается
+        rejected = []
+        with self.connection:
+            for position, row in enumerate(rows):
+                try:
+                    self.connection.execute(self.sql, row)
+                except sqlite3.IntegrityError as e:
+                    rejected.append((position, str(e)))
+        return rejected
+
+
+def chunk_loader(connection, use_copy=True):
+    if isinstance(connection, sqlite3.Connection):
+        return SqliteLoader(connection)
+    return PostgresLoader(connection, use_copy)
+
+
+def import_users(path, connection, rejects_path=None, chunk_size=CHUNK_SIZE, use_copy=True, on_progress=None):
+    """Потоково загружает пользователей из файла в таблицу users, не читая файл целиком."""
+    stats = ImportStats(os.path.getsize(path))
+    loader = chunk_loader(connection, use_copy)
+    rejects_path = rejects_path or path + ".rejects.csv"
+    with open(rejects_path, "w", encoding="utf-8", newline="") as f:
+        rejects = csv.writer(f)
+        rejects.writerow(["line", "reason", "record"])
+        rows = valid_rows(read_records(path, stats), rejects, stats)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            rejected = loader.load([row for number, row in chunk])
+            for position, reason in rejected:
+                number, row = chunk[position]
+                rejects.writerow([number, reason, json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False)])
+            stats.imported += len(chunk) - len(rejected)
+            stats.rejected += len(rejected)
+            if on_progress is not None:
+                on_progress(stats)
+    return stats
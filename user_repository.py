@@ -0,0 +1,267 @@
+import re
+import sqlite3
+from time import perf_counter_ns
+
+# Запросы пишутся с параметрами $1, $2, ...: в PostgreSQL это PREPARE, в SQLite — ?1, ?2, ...
+# Листание и поиск идут в порядке кодов символов (COLLATE "C"): при другой сортировке базы (en_US.UTF-8)
+# ключ страницы и префикс не совпали бы с порядком индекса
+STATEMENTS = {
+    "user_authenticate": ("text, text", "SELECT 1 FROM users WHERE login = $1 AND password = $2"),
+    "user_find": ("text, text",
+                  "SELECT login, password, fio, email, phone FROM users WHERE login = $1 AND password = $2"),
+    "user_profile": ("text", "SELECT login, password, fio, email, phone FROM users WHERE login = $1"),
+    "user_page_forward": ("text, integer",
+                          'SELECT login, fio, email FROM users WHERE login COLLATE "C" > $1 '
+                          'ORDER BY login COLLATE "C" LIMIT $2'),
+    "user_page_backward": ("text, integer",
+                           'SELECT login, fio, email FROM users WHERE login COLLATE "C" < $1 '
+                           'ORDER BY login COLLATE "C" DESC LIMIT $2'),
+    "user_search_forward": ("text, text, integer",
+                            'SELECT login, fio, email FROM users WHERE login COLLATE "C" > $1 '
+                            'AND login COLLATE "C" LIKE $2 ORDER BY login COLLATE "C" LIMIT $3'),
+    "user_search_backward": ("text, text, integer",
+                             'SELECT login, fio, email FROM users WHERE login COLLATE "C" < $1 '
+                             'AND login COLLATE "C" LIKE $2 ORDER BY login COLLATE "C" DESC LIMIT $3'),
+}
+# Индекс для листания и поиска по префиксу; в SQLite не нужен — там обычный индекс уже в порядке кодов
+BROWSE_INDEX = 'CREATE INDEX IF NOT EXISTS users_login_c ON users (login COLLATE "C")'
+SCHEMA = (
+    # Ключи идемпотентности отложенных вставок (write_queue): повтор пачки не создаёт дублей
+    "CREATE TABLE IF NOT EXISTS user_write_keys (key TEXT PRIMARY KEY)",
+    BROWSE_INDEX,
+    # Последним: на базе с дублями логинов индекс не создаётся, но остальная схема уже на месте
+    "CREATE UNIQUE INDEX IF NOT EXISTS users_login_key ON users (login)",
+)
+IDEMPOTENT_INSERT = (
+    "WITH new_key AS (INSERT INTO user_write_keys (key) VALUES (%s) ON CONFLICT DO NOTHING RETURNING key) "
+    "INSERT INTO users (login, password, fio, email, phone) SELECT %s, %s, %s, %s, %s FROM new_key"
+)
+PAGE_SIZE = 100
+
+
+def record_query(metrics, name, start, executed):
+    """Время выполнения и выборки запроса в гистограммах db.<name>.execute и db.<name>.fetch."""
+    if metrics is not None:
+        metrics.record(f"db.{name}.execute", executed - start)
+        metrics.record(f"db.{name}.fetch", perf_counter_ns() - executed)
+
+
+def sqlite_dialect(sql):
+    """Запрос для SQLite: там сравнение строк и так побайтовое, а LIKE без учёта регистра, поэтому GLOB."""
+    sql = sql.replace(' COLLATE "C" LIKE ', " GLOB ").replace(' COLLATE "C"', "")
+    return re.sub(r"\$(\d+)", r"?\1", sql)
+
+
+class UserRecord:
+    """Профиль пользователя: только колонки, которые показывает UserInfoScreen."""
+
+    __slots__ = ("login", "password", "fio", "email", "phone")
+
+    def __init__(self, login, password, fio, email, phone):
+        self.login = login
+        self.password = password
+        self.fio = fio
+        self.email = email
+        self.phone = phone
+
+    def __repr__(self):
+        return f"UserRecord(login={self.login!r})"
+
+
+class PostgresBackend:
+    """Серверные подготовленные запросы: PREPARE один раз на соединение, дальше EXECUTE."""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics  # db_metrics.Metrics или None
+
+    def prepare(self, connection):
+        with connection.cursor() as cursor:
+            for name, (types, sql) in STATEMENTS.items():
+                cursor.execute(f"PREPARE {name} ({types}) AS {sql}")
+
+    def execute(self, connection, name, args, fetch_all=False):
+        start = perf_counter_ns()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+            executed = perf_counter_ns()
+            if cursor.description is None:
+                rows = None
+            else:
+                rows = cursor.fetchall() if fetch_all else cursor.fetchone()
+        record_query(self.metrics, name, start, executed)
+        return rows
+
+    def prefix_pattern(self, prefix):
+        """Шаблон LIKE для логинов с префиксом; % и _ в самом префиксе экранируются."""
+        return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    def ensure_schema(self, connection):
+        import psycopg2
+        with connection.cursor() as cursor:
+            for statement in SCHEMA:
+                try:
+                    cursor.execute(statement)
+                except psycopg2.IntegrityError as e:
+                    # Дубли логинов в базе: уникальный индекс не построить, запросы работают и без него
+                    print(f"Schema check: {e}")
+
+    def insert_batch(self, connection, rows):
+        """Идемпотентная вставка пачки (key, login, password, fio, email, phone); возвращает отклонённые ключи."""
+        import psycopg2
+        # Ошибки, в которых виновата сама строка: дубль логина, слишком длинное значение и т. п.
+        row_errors = (psycopg2.IntegrityError, psycopg2.DataError)
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN")
+            try:
+                cursor.executemany(IDEMPOTENT_INSERT, rows)
+                cursor.execute("COMMIT")
+                return []
+            except row_errors:
+                cursor.execute("ROLLBACK")
+            except BaseException:
+                # Соединение из пула в autocommit не должно вернуться туда с открытой транзакцией
+                cursor.execute("ROLLBACK")
+                raise
+            # В пачке есть плохая строка: повторяем по одной, изолируя ошибки точками сохранения
+            rejected = []
+            cursor.execute("BEGIN")
+            try:
+                for row in rows:
+                    cursor.execute("SAVEPOINT row")
+                    try:
+                        cursor.execute(IDEMPOTENT_INSERT, row)
+                    except row_errors:
+                        cursor.execute("ROLLBACK TO SAVEPOINT row")
+                        rejected.append(row[0])
+                    else:
+                        cursor.execute("RELEASE SAVEPOINT row")
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            return rejected
+
+
+class SqliteBackend:
+    """Локальная замена сервера для разработки и замеров; sqlite3 сам кеширует подготовленные запросы."""
+
+    def __init__(self, metrics=None):
+        self.sql = {name: sqlite_dialect(sql) for name, (types, sql) in STATEMENTS.items()}
+        self.metrics = metrics
+
+    def prepare(self, connection):
+        pass
+
+    def execute(self, connection, name, args, fetch_all=False):
+        start = perf_counter_ns()
+        with connection:
+            cursor = connection.execute(self.sql[name], args)
+            executed = perf_counter_ns()
+            rows = cursor.fetchall() if fetch_all else cursor.fetchone()
+        record_query(self.metrics, name, start, executed)
+        return rows
+
+    def prefix_pattern(self, prefix):
+        """Шаблон GLOB: спецсимволы префикса берутся в скобки."""
+        return re.sub(r"([*?[])", r"[\1]", prefix) + "*"
+
+    def ensure_schema(self, connection):
+        for statement in SCHEMA:
+            if statement is BROWSE_INDEX:
+                continue
+            try:
+                connection.execute(statement)
+            except sqlite3.IntegrityError as e:
+                print(f"Schema check: {e}")
+
+    def insert_batch(self, connection, rows):
+        rejected = []
+        with connection:
+            for key, *row in rows:
+                if not connection.execute("INSERT OR IGNORE INTO user_write_keys (key) VALUES (?)", (key,)).rowcount:
+                    continue  # пачка уже была доставлена раньше
+                try:
+                    connection.execute("INSERT INTO users (login, password, fio, email, phone) VALUES (?, ?, ?, ?, ?)",
+                                       row)
+                except sqlite3.IntegrityError:
+                    rejected.append(key)
+        return rejected
+
+
+class UserRepository:
+    def __init__(self, pool, backend, cache=None):
+        self.pool = pool
+        self.backend = backend
+        self.cache = cache  # ProfileCache или None
+        self.schema_checked = False
+
+    def _execute(self, name, *args, fetch_all=False):
+        with self.pool.connection() as connection:
+            self._check_schema(connection)
+            return self.backend.execute(connection, name, args, fetch_all)
+
+    def _check_schema(self, connection):
+        if self.schema_checked:
+            return
+        try:
+            self.backend.ensure_schema(connection)
+        except Exception as e:
+            # Сбой (нет связи, блокировка) не отмечает схему проверенной: следующий запрос повторит
+            print(f"Schema check failed: {e}")
+            return
+        self.schema_checked = True
+
+    def check_schema(self):
+        """Проверка схемы при запуске, до первых запросов."""
+        with self.pool.connection() as connection:
+            self._check_schema(connection)
+
+    def authenticate(self, login, password):
+        return self._execute("user_authenticate", login, password) is not None
+
+    def find(self, login, password):
+        row = self._execute("user_find", login, password)
+        return UserRecord(*row) if row else None
+
+    def login(self, login, password):
+        """Пароль проверяется в базе всегда, из кеша берётся только профиль."""
+        record = self.cache.get(login) if self.cache is not None else None
+        if record is not None:
+            return record if self.authenticate(login, password) else None
+        record = self.find(login, password)
+        if record is not None and self.cache is not None:
+            self.cache.put(login, record)
+        return record
+
+    def profile(self, login):
+        row = self._execute("user_profile", login)
+        return UserRecord(*row) if row else None
+
+    def add_batch(self, rows):
+        """Доставка пачки из write_queue: строки (key, login, password, fio, email, phone)."""
+        with self.pool.connection() as connection:
+            self._check_schema(connection)
+            rejected = self.backend.insert_batch(connection, rows)
+        if self.cache is not None:
+            skip = set(rejected)
+            for key, login, password, fio, email, phone in rows:
+                if key not in skip:
+                    self.cache.put(login, UserRecord(login, password, fio, email, phone))
+        return rejected
+
+    def page_after(self, after, prefix="", limit=PAGE_SIZE):
+        """Keyset-страница (login, fio, email) после логина after, без OFFSET."""
+        if not prefix:
+            return self._execute("user_page_forward", after, limit, fetch_all=True)
+        return self._execute("user_search_forward", after, self.backend.prefix_pattern(prefix), limit,
+                             fetch_all=True)
+
+    def page_before(self, before, prefix="", limit=PAGE_SIZE):
+        """Страница перед логином before, по возрастанию login."""
+        if not prefix:
+            rows = self._execute("user_page_backward", before, limit, fetch_all=True)
+        else:
+            rows = self._execute("user_search_backward", before, self.backend.prefix_pattern(prefix), limit,
+                                 fetch_all=True)
+        rows.reverse()
+        return rows
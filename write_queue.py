@@ -0,0 +1,104 @@
+import random
+import sqlite3
+import threading
+import uuid
+
+BATCH_SIZE = 500
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+
+PENDING = 0
+REJECTED = 1
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS pending_users (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    login TEXT, password TEXT, fio TEXT, email TEXT, phone TEXT,
+    status INTEGER NOT NULL DEFAULT 0
+)"""
+
+
+class WriteBehindQueue:
+    """Долговременная очередь вставок: запись в локальный SQLite (WAL), доставка в фоне пачками."""
+
+    def __init__(self, path, send_batch, on_change=None, batch_size=BATCH_SIZE):
+        self.path = path
+        self.send_batch = send_batch  # rows -> список отклонённых ключей; исключение = повторить позже
+        self.on_change = on_change    # вызывается из фонового потока
+        self.batch_size = batch_size
+        self.pending = 0
+        self.rejected = 0
+        self.db = None
+        self.thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(SCHEMA)
+        return connection
+
+    def start(self):
+        self.db = self._connect()
+        counts = dict(self.db.execute("SELECT status, count(*) FROM pending_users GROUP BY status").fetchall())
+        self.pending = counts.get(PENDING, 0)
+        self.rejected = counts.get(REJECTED, 0)
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        self._wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.db is not None:
+            self.db.close()
+
+    def enqueue(self, login, password, fio, email, phone):
+        """Сохраняет вставку локально и сразу возвращает ключ идемпотентности."""
+        key = uuid.uuid4().hex
+        self.db.execute("INSERT INTO pending_users (key, login, password, fio, email, phone) VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, login, password, fio, email, phone))
+        with self._lock:
+            self.pending += 1
+        self._wake.set()
+        return key
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(self.pending, self.rejected)
+
+    def _run(self):
+        db = self._connect()
+        failures = 0
+        while not self._stopping.is_set():
+            rows = db.execute("SELECT id, key, login, password, fio, email, phone FROM pending_users "
+                              "WHERE status = ? ORDER BY id LIMIT ?", (PENDING, self.batch_size)).fetchall()
+            if not rows:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                rejected = set(self.send_batch([row[1:] for row in rows]))
+            except Exception as e:
+                # Экспоненциальная задержка со случайным разбросом, новая вставка её не прерывает
+                failures += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (failures - 1)) * random.uniform(0.5, 1.0)
+                print(f"write-behind: {e}; retry in {delay:.1f} s")
+                self._stopping.wait(delay)
+                continue
+            failures = 0
+            with db:
+                db.execute("BEGIN")
+                db.executemany("DELETE FROM pending_users WHERE id = ?",
+                               [(row[0],) for row in rows if row[1] not in rejected])
+                db.executemany("UPDATE pending_users SET status = ? WHERE key = ?",
+                               [(REJECTED, key) for key in rejected])
+            with self._lock:
+                self.pending -= len(rows)
+                self.rejected += len(rejected)
+            self._notify()
+        db.close()